@@ -8,7 +8,14 @@ import os
 
 HEADER_AND_UTIL_CODE = r"""use arrayref::array_ref;
 use pyo3::prelude::*;
-use pyo3::exceptions::PyValueError;
+use pyo3::exceptions::{PyIndexError, PyValueError};
+use pyo3::buffer::PyBuffer;
+use pyo3::sync::{GILOnceCell, GILProtected};
+use pyo3::types::{PyBytes, PyDict, PyString, PyTuple};
+use std::cell::RefCell;
+use std::fs::File;
+use std::io::{self, BufReader, BufWriter, Read, Seek, SeekFrom, Write};
+use std::sync::atomic::{fence, AtomicU32, AtomicU64, Ordering};
 
 pub fn string_to_char_array<const N: usize>(s: &str) -> Result<[char; N], &'static str> {
     if s.len() > N {
@@ -27,6 +34,11 @@ pub fn string_to_char_array<const N: usize>(s: &str) -> Result<[char; N], &'stat
     Ok(char_array)
 }
 
+pub fn char_array_to_string(chars: &[char]) -> String {
+    let s: String = chars.iter().collect();
+    s.trim_end_matches(' ').to_string()
+}
+
 #[derive(Debug, PartialEq)]
 pub struct Header {
     pub msg_size: u32,
@@ -34,46 +46,2353 @@ pub struct Header {
     pub bitmask: u32,
 }
 
-impl Header {
-    pub fn to_bytes(&self) -> [u8; 9] {
-        let size_bytes = self.msg_size.to_be_bytes();
-        let mask_bytes = self.bitmask.to_be_bytes();
+impl Header {
+    pub fn to_bytes(&self) -> [u8; 9] {
+        let size_bytes = self.msg_size.to_be_bytes();
+        let mask_bytes = self.bitmask.to_be_bytes();
+
+        [
+            size_bytes[0],
+            size_bytes[1],
+            size_bytes[2],
+            size_bytes[3],
+            self.msg_type,
+            mask_bytes[0],
+            mask_bytes[1],
+            mask_bytes[2],
+            mask_bytes[3],
+        ]
+    }
+
+    pub fn from_bytes(buffer: &[u8; 9]) -> Self {
+        let msg_size = u32::from_be_bytes([buffer[0], buffer[1], buffer[2], buffer[3]]);
+        let msg_type = buffer[4];
+        let bitmask = u32::from_be_bytes([buffer[5], buffer[6], buffer[7], buffer[8]]);
+
+        Self {
+            msg_size,
+            msg_type,
+            bitmask,
+        }
+    }
+}
+
+pub struct FrameIter<'a> {
+    buffer: &'a [u8],
+    offset: usize,
+}
+
+// Splits a buffer of concatenated frames using the `msg_size` of each header
+pub fn frames(buffer: &[u8]) -> FrameIter<'_> {
+    FrameIter { buffer, offset: 0 }
+}
+
+impl<'a> Iterator for FrameIter<'a> {
+    type Item = Result<&'a [u8], &'static str>;
+
+    fn next(&mut self) -> Option<Self::Item> {
+        let remaining = &self.buffer[self.offset..];
+        if remaining.is_empty() {
+            return None;
+        }
+        if remaining.len() < 9 {
+            self.offset = self.buffer.len();
+            return Some(Err("Buffer too short for header"));
+        }
+
+        let msg_size = Header::from_bytes(array_ref![remaining, 0, 9]).msg_size as usize;
+        if msg_size < 9 || msg_size > remaining.len() {
+            self.offset = self.buffer.len();
+            return Some(Err("Invalid frame: msg_size"));
+        }
+
+        self.offset += msg_size;
+        Some(Ok(&remaining[..msg_size]))
+    }
+}
+
+// Reads frames one at a time from a stream, reusing a single frame buffer
+pub struct FrameReader<R: Read> {
+    inner: R,
+    frame: Vec<u8>,
+}
+
+impl<R: Read> FrameReader<R> {
+    pub fn new(inner: R) -> Self {
+        Self {
+            inner,
+            frame: Vec::new(),
+        }
+    }
+
+    pub fn next_frame(&mut self) -> io::Result<Option<&[u8]>> {
+        let mut header = [0u8; 9];
+        let mut filled = 0;
+        while filled < 9 {
+            match self.inner.read(&mut header[filled..]) {
+                Ok(0) if filled == 0 => return Ok(None),
+                Ok(0) => return Err(io::Error::new(io::ErrorKind::UnexpectedEof, "Truncated frame header")),
+                Ok(n) => filled += n,
+                Err(e) if e.kind() == io::ErrorKind::Interrupted => {}
+                Err(e) => return Err(e),
+            }
+        }
+
+        // Bounded by the largest format so a corrupt header cannot trigger a huge allocation
+        let msg_size = Header::from_bytes(&header).msg_size as usize;
+        if msg_size < 9 || msg_size > MAX_FRAME_SIZE {
+            return Err(io::Error::new(io::ErrorKind::InvalidData, "Invalid frame: msg_size"));
+        }
+        self.frame.clear();
+        self.frame.extend_from_slice(&header);
+        self.frame.resize(msg_size, 0);
+        self.inner.read_exact(&mut self.frame[9..])?;
+        Ok(Some(&self.frame))
+    }
+}
+
+#[pyclass]
+struct PyMessage {
+    message: Message,
+}
+
+#[pymodule]
+fn xparse(_py: Python, m: &PyModule) -> PyResult<()> {
+    m.add_class::<PyMessage>()?;
+    m.add_class::<PyBlockWriter>()?;
+    m.add_class::<PyBlockReader>()?;
+    m.add_class::<PyRingProducer>()?;
+    m.add_class::<PyRingConsumer>()?;
+    m.add_class::<PyAggregator>()?;
+    m.add_class::<PySnapshotCache>()?;
+    m.add_class::<PyMergeIterator>()?;
+    Ok(())
+}
+"""
+
+
+BLOCK_CONTAINER_CODE = r"""
+// Block container layout (all integers big endian, like the frame header):
+//
+//   "XPBC" | version: u8 | block 0 | block 1 | ... | index | index_offset: u64 | "XPBI"
+//
+// Each block holds up to `frames_per_block` concatenated frames compressed with one codec.
+// The index records, per block: offset, compressed_len, raw_len, frame_count, codec and
+// a (msg_type, count) summary, so readers can seek to and decompress only what they need.
+pub const BLOCK_MAGIC: &[u8; 4] = b"XPBC";
+pub const INDEX_MAGIC: &[u8; 4] = b"XPBI";
+pub const BLOCK_CONTAINER_VERSION: u8 = 1;
+
+fn invalid_data(message: &'static str) -> io::Error {
+    io::Error::new(io::ErrorKind::InvalidData, message)
+}
+
+// New codecs are added as a variant plus their compress/decompress arms; the id is stored per block
+#[derive(Clone, Copy, PartialEq, Debug)]
+pub enum Codec {
+    Raw = 0,
+    Zlib = 1,
+}
+
+impl Codec {
+    pub fn from_u8(value: u8) -> Result<Self, &'static str> {
+        match value {
+            0 => Ok(Codec::Raw),
+            1 => Ok(Codec::Zlib),
+            _ => Err("Invalid value for enum Codec"),
+        }
+    }
+
+    pub fn to_u8(&self) -> u8 {
+        match self {
+            Codec::Raw => 0,
+            Codec::Zlib => 1,
+        }
+    }
+
+    pub fn from_name(name: &str) -> Result<Self, &'static str> {
+        match name {
+            "raw" => Ok(Codec::Raw),
+            "zlib" => Ok(Codec::Zlib),
+            _ => Err("Unknown codec name"),
+        }
+    }
+
+    pub fn name(&self) -> &'static str {
+        match self {
+            Codec::Raw => "raw",
+            Codec::Zlib => "zlib",
+        }
+    }
+
+    pub fn compress(&self, raw: &[u8]) -> io::Result<Vec<u8>> {
+        match self {
+            Codec::Raw => Ok(raw.to_vec()),
+            Codec::Zlib => {
+                let mut encoder = flate2::write::ZlibEncoder::new(
+                    Vec::with_capacity(raw.len() / 4),
+                    flate2::Compression::default(),
+                );
+                encoder.write_all(raw)?;
+                encoder.finish()
+            }
+        }
+    }
+
+    pub fn decompress(&self, data: &[u8], raw_len: usize) -> io::Result<Vec<u8>> {
+        let raw = match self {
+            Codec::Raw => data.to_vec(),
+            Codec::Zlib => {
+                let mut raw = Vec::with_capacity(raw_len);
+                flate2::read::ZlibDecoder::new(data).read_to_end(&mut raw)?;
+                raw
+            }
+        };
+        if raw.len() != raw_len {
+            return Err(invalid_data("Block length does not match index"));
+        }
+        Ok(raw)
+    }
+}
+
+#[derive(Clone, PartialEq, Debug)]
+pub struct BlockInfo {
+    pub offset: u64,
+    pub compressed_len: u32,
+    pub raw_len: u32,
+    pub frame_count: u32,
+    pub codec: Codec,
+    pub msg_type_counts: Vec<(u8, u32)>,
+}
+
+impl BlockInfo {
+    fn write_to(&self, buf: &mut Vec<u8>) {
+        buf.extend_from_slice(&self.offset.to_be_bytes());
+        buf.extend_from_slice(&self.compressed_len.to_be_bytes());
+        buf.extend_from_slice(&self.raw_len.to_be_bytes());
+        buf.extend_from_slice(&self.frame_count.to_be_bytes());
+        buf.push(self.codec.to_u8());
+        buf.push(self.msg_type_counts.len() as u8);
+        for (msg_type, count) in &self.msg_type_counts {
+            buf.push(*msg_type);
+            buf.extend_from_slice(&count.to_be_bytes());
+        }
+    }
+
+    fn read_from(buffer: &[u8], offset: &mut usize) -> Result<Self, &'static str> {
+        if buffer.len() < *offset + 22 {
+            return Err("Invalid block index: truncated entry");
+        }
+        let entry = &buffer[*offset..];
+        let n_types = entry[21] as usize;
+        if entry.len() < 22 + n_types * 5 {
+            return Err("Invalid block index: truncated entry");
+        }
+
+        let mut msg_type_counts = Vec::with_capacity(n_types);
+        for i in 0..n_types {
+            let at = 22 + i * 5;
+            msg_type_counts.push((entry[at], u32::from_be_bytes(*array_ref![entry, at + 1, 4])));
+        }
+        *offset += 22 + n_types * 5;
+
+        Ok(Self {
+            offset: u64::from_be_bytes(*array_ref![entry, 0, 8]),
+            compressed_len: u32::from_be_bytes(*array_ref![entry, 8, 4]),
+            raw_len: u32::from_be_bytes(*array_ref![entry, 12, 4]),
+            frame_count: u32::from_be_bytes(*array_ref![entry, 16, 4]),
+            codec: Codec::from_u8(entry[20])?,
+            msg_type_counts,
+        })
+    }
+
+    pub fn contains_msg_type(&self, msg_type: u8) -> bool {
+        self.msg_type_counts.iter().any(|(t, _)| *t == msg_type)
+    }
+}
+
+pub struct BlockWriter<W: Write> {
+    inner: W,
+    codec: Codec,
+    frames_per_block: usize,
+    position: u64,
+    pending: Vec<u8>,
+    pending_counts: [u32; 256],
+    pending_frames: usize,
+    index: Vec<BlockInfo>,
+}
+
+impl<W: Write> BlockWriter<W> {
+    pub fn new(mut inner: W, frames_per_block: usize, codec: Codec) -> io::Result<Self> {
+        if frames_per_block == 0 {
+            return Err(io::Error::new(io::ErrorKind::InvalidInput, "frames_per_block must be positive"));
+        }
+        inner.write_all(BLOCK_MAGIC)?;
+        inner.write_all(&[BLOCK_CONTAINER_VERSION])?;
+
+        Ok(Self {
+            inner,
+            codec,
+            frames_per_block,
+            position: 5,
+            pending: Vec::new(),
+            pending_counts: [0; 256],
+            pending_frames: 0,
+            index: Vec::new(),
+        })
+    }
+
+    pub fn push_frame(&mut self, frame: &[u8]) -> io::Result<()> {
+        let mut it = frames(frame);
+        match (it.next(), it.next()) {
+            (Some(Ok(_)), None) => {}
+            (Some(Err(e)), _) => return Err(invalid_data(e)),
+            _ => return Err(invalid_data("Expected exactly one frame")),
+        }
+        // Also keeps the per-block msg_type summary within its one-byte count
+        if MessageSpec::by_msg_type(frame[4]).is_none() {
+            return Err(invalid_data("Unknown message type id"));
+        }
+
+        self.pending.extend_from_slice(frame);
+        self.pending_counts[frame[4] as usize] += 1;
+        self.pending_frames += 1;
+        if self.pending_frames == self.frames_per_block {
+            self.flush_block()?;
+        }
+        Ok(())
+    }
+
+    pub fn push_frames(&mut self, buffer: &[u8]) -> io::Result<()> {
+        for frame in frames(buffer) {
+            self.push_frame(frame.map_err(invalid_data)?)?;
+        }
+        Ok(())
+    }
+
+    fn flush_block(&mut self) -> io::Result<()> {
+        if self.pending_frames == 0 {
+            return Ok(());
+        }
+        let compressed = self.codec.compress(&self.pending)?;
+        self.inner.write_all(&compressed)?;
+
+        let msg_type_counts = (0..256)
+            .filter(|&t| self.pending_counts[t] != 0)
+            .map(|t| (t as u8, self.pending_counts[t]))
+            .collect();
+        self.index.push(BlockInfo {
+            offset: self.position,
+            compressed_len: compressed.len() as u32,
+            raw_len: self.pending.len() as u32,
+            frame_count: self.pending_frames as u32,
+            codec: self.codec,
+            msg_type_counts,
+        });
+
+        self.position += compressed.len() as u64;
+        self.pending.clear();
+        self.pending_counts = [0; 256];
+        self.pending_frames = 0;
+        Ok(())
+    }
+
+    pub fn finish(mut self) -> io::Result<W> {
+        self.flush_block()?;
+
+        let mut index_bytes = Vec::new();
+        index_bytes.extend_from_slice(&(self.index.len() as u32).to_be_bytes());
+        for info in &self.index {
+            info.write_to(&mut index_bytes);
+        }
+        index_bytes.extend_from_slice(&self.position.to_be_bytes());
+        index_bytes.extend_from_slice(INDEX_MAGIC);
+
+        self.inner.write_all(&index_bytes)?;
+        self.inner.flush()?;
+        Ok(self.inner)
+    }
+}
+
+pub struct BlockReader<R: Read + Seek> {
+    inner: R,
+    index: Vec<BlockInfo>,
+}
+
+impl<R: Read + Seek> BlockReader<R> {
+    pub fn new(mut inner: R) -> io::Result<Self> {
+        let mut preamble = [0u8; 5];
+        inner.seek(SeekFrom::Start(0))?;
+        inner.read_exact(&mut preamble)?;
+        if &preamble[..4] != BLOCK_MAGIC || preamble[4] != BLOCK_CONTAINER_VERSION {
+            return Err(invalid_data("Not a block container"));
+        }
+
+        let end = inner.seek(SeekFrom::End(-12))?;
+        let mut trailer = [0u8; 12];
+        inner.read_exact(&mut trailer)?;
+        if &trailer[8..] != INDEX_MAGIC {
+            return Err(invalid_data("Missing block index"));
+        }
+        let index_offset = u64::from_be_bytes(*array_ref![trailer, 0, 8]);
+        if index_offset < 5 || index_offset > end {
+            return Err(invalid_data("Invalid block index offset"));
+        }
+
+        let mut index_bytes = vec![0u8; (end - index_offset) as usize];
+        inner.seek(SeekFrom::Start(index_offset))?;
+        inner.read_exact(&mut index_bytes)?;
+        if index_bytes.len() < 4 {
+            return Err(invalid_data("Invalid block index: truncated entry"));
+        }
+
+        // Entries are at least 22 bytes, so a corrupt count cannot trigger a huge allocation
+        let block_count = u32::from_be_bytes(*array_ref![index_bytes, 0, 4]) as usize;
+        if block_count > (index_bytes.len() - 4) / 22 {
+            return Err(invalid_data("Invalid block index: block count"));
+        }
+        let mut offset = 4;
+        let mut index = Vec::with_capacity(block_count);
+        for _ in 0..block_count {
+            let info = BlockInfo::read_from(&index_bytes, &mut offset).map_err(invalid_data)?;
+            if info.offset + info.compressed_len as u64 > index_offset {
+                return Err(invalid_data("Invalid block index: block out of range"));
+            }
+            // raw_len and frame_count size the decompression and decode buffers
+            if info.raw_len as u64 > info.frame_count as u64 * MAX_FRAME_SIZE as u64
+                || info.frame_count as u64 > info.raw_len as u64 / 9
+            {
+                return Err(invalid_data("Invalid block index: block length"));
+            }
+            index.push(info);
+        }
+
+        Ok(Self { inner, index })
+    }
+
+    pub fn index(&self) -> &[BlockInfo] {
+        &self.index
+    }
+
+    // Indices of the blocks whose summary says they hold at least one frame of `msg_type`
+    pub fn blocks_with_msg_type(&self, msg_type: u8) -> Vec<usize> {
+        (0..self.index.len())
+            .filter(|&i| self.index[i].contains_msg_type(msg_type))
+            .collect()
+    }
+
+    fn block_info(&self, block: usize) -> io::Result<&BlockInfo> {
+        self.index
+            .get(block)
+            .ok_or_else(|| io::Error::new(io::ErrorKind::InvalidInput, "Block index out of range"))
+    }
+
+    pub fn read_compressed(&mut self, block: usize) -> io::Result<Vec<u8>> {
+        let info = self.block_info(block)?;
+        let (offset, len) = (info.offset, info.compressed_len as usize);
+
+        let mut data = vec![0u8; len];
+        self.inner.seek(SeekFrom::Start(offset))?;
+        self.inner.read_exact(&mut data)?;
+        Ok(data)
+    }
+
+    // Raw concatenated frames of one block
+    pub fn read_block(&mut self, block: usize) -> io::Result<Vec<u8>> {
+        let data = self.read_compressed(block)?;
+        let info = &self.index[block];
+        info.codec.decompress(&data, info.raw_len as usize)
+    }
+
+    // Reads the requested blocks sequentially, then decompresses and decodes them on a
+    // pool of scoped threads. Messages are returned in the order of `blocks`.
+    pub fn decode_blocks(&mut self, blocks: &[usize]) -> io::Result<Vec<Message>> {
+        let mut jobs = Vec::with_capacity(blocks.len());
+        for &block in blocks {
+            let data = self.read_compressed(block)?;
+            jobs.push((self.index[block].clone(), data));
+        }
+
+        let workers = std::thread::available_parallelism()
+            .map(|n| n.get())
+            .unwrap_or(1)
+            .min(jobs.len())
+            .max(1);
+        let chunk_size = (jobs.len() + workers - 1) / workers;
+
+        let decoded: Vec<io::Result<Vec<Message>>> = std::thread::scope(|scope| {
+            let handles: Vec<_> = jobs
+                .chunks(chunk_size.max(1))
+                .map(|chunk| scope.spawn(move || decode_block_chunk(chunk)))
+                .collect();
+            handles
+                .into_iter()
+                .map(|h| h.join().unwrap_or_else(|_| Err(invalid_data("Block decoder panicked"))))
+                .collect()
+        });
+
+        let mut messages = Vec::new();
+        for chunk in decoded {
+            messages.extend(chunk?);
+        }
+        Ok(messages)
+    }
+}
+
+fn decode_block_chunk(chunk: &[(BlockInfo, Vec<u8>)]) -> io::Result<Vec<Message>> {
+    let mut messages = Vec::new();
+    for (info, data) in chunk {
+        let raw = info.codec.decompress(data, info.raw_len as usize)?;
+        messages.reserve(info.frame_count as usize);
+        for frame in frames(&raw) {
+            messages.push(Message::deserialize(frame.map_err(invalid_data)?).map_err(invalid_data)?);
+        }
+    }
+    Ok(messages)
+}
+
+#[pyclass]
+struct PyBlockWriter {
+    writer: Option<BlockWriter<BufWriter<File>>>,
+}
+
+#[pymethods]
+impl PyBlockWriter {
+    #[new]
+    #[pyo3(signature = (path, frames_per_block=4096, codec="zlib"))]
+    fn new(path: &str, frames_per_block: usize, codec: &str) -> PyResult<Self> {
+        if frames_per_block == 0 {
+            return Err(PyValueError::new_err("frames_per_block must be positive"));
+        }
+        let codec = Codec::from_name(codec).map_err(PyValueError::new_err)?;
+        let file = BufWriter::new(File::create(path)?);
+        Ok(Self {
+            writer: Some(BlockWriter::new(file, frames_per_block, codec)?),
+        })
+    }
+
+    fn push(&mut self, frame: &[u8]) -> PyResult<()> {
+        self.writer_mut()?.push_frame(frame).map_err(block_error)
+    }
+
+    fn extend(&mut self, buffer: &[u8]) -> PyResult<()> {
+        self.writer_mut()?.push_frames(buffer).map_err(block_error)
+    }
+
+    fn close(&mut self) -> PyResult<()> {
+        if let Some(writer) = self.writer.take() {
+            writer.finish()?;
+        }
+        Ok(())
+    }
+
+    fn __enter__(slf: PyRef<'_, Self>) -> PyRef<'_, Self> {
+        slf
+    }
+
+    fn __exit__(&mut self, _exc_type: PyObject, _exc_value: PyObject, _traceback: PyObject) -> PyResult<()> {
+        self.close()
+    }
+}
+
+impl PyBlockWriter {
+    fn writer_mut(&mut self) -> PyResult<&mut BlockWriter<BufWriter<File>>> {
+        self.writer
+            .as_mut()
+            .ok_or_else(|| PyValueError::new_err("Block writer is closed"))
+    }
+}
+
+// Like a Python file object, a writer that is dropped without close() still finishes the file
+impl Drop for PyBlockWriter {
+    fn drop(&mut self) {
+        if let Some(writer) = self.writer.take() {
+            let _ = writer.finish();
+        }
+    }
+}
+
+// Malformed frames and corrupt containers surface as ValueError, everything else as OSError
+fn block_error(e: io::Error) -> PyErr {
+    match e.kind() {
+        io::ErrorKind::InvalidData => PyValueError::new_err(e.to_string()),
+        _ => e.into(),
+    }
+}
+
+#[pyclass]
+struct PyBlockReader {
+    reader: BlockReader<BufReader<File>>,
+}
+
+#[pymethods]
+impl PyBlockReader {
+    #[new]
+    fn new(path: &str) -> PyResult<Self> {
+        Ok(Self {
+            reader: BlockReader::new(BufReader::new(File::open(path)?)).map_err(block_error)?,
+        })
+    }
+
+    fn __len__(&self) -> usize {
+        self.reader.index().len()
+    }
+
+    // One (offset, compressed_len, raw_len, frame_count, codec, {msg_type: count}) tuple per block
+    fn index(&self) -> Vec<(u64, u32, u32, u32, &'static str, std::collections::HashMap<u8, u32>)> {
+        self.reader
+            .index()
+            .iter()
+            .map(|info| {
+                (
+                    info.offset,
+                    info.compressed_len,
+                    info.raw_len,
+                    info.frame_count,
+                    info.codec.name(),
+                    info.msg_type_counts.iter().cloned().collect(),
+                )
+            })
+            .collect()
+    }
+
+    fn read_block(&mut self, py: Python, block: usize) -> PyResult<PyObject> {
+        if block >= self.reader.index().len() {
+            return Err(PyIndexError::new_err("Block index out of range"));
+        }
+        let raw = self.reader.read_block(block).map_err(block_error)?;
+        Ok(PyBytes::new(py, &raw).into())
+    }
+
+    #[pyo3(signature = (blocks=None, msg_type=None))]
+    fn decode_blocks(
+        &mut self,
+        py: Python,
+        blocks: Option<Vec<usize>>,
+        msg_type: Option<&str>,
+    ) -> PyResult<Vec<PyMessage>> {
+        let mut blocks = blocks.unwrap_or_else(|| (0..self.reader.index().len()).collect());
+        if let Some(name) = msg_type {
+            let msg_type = Message::msg_type_from_name(name)
+                .ok_or_else(|| PyValueError::new_err("Unknown message format"))?;
+            blocks.retain(|&b| self.reader.index().get(b).map_or(true, |i| i.contains_msg_type(msg_type)));
+        }
+        if let Some(&b) = blocks.iter().find(|&&b| b >= self.reader.index().len()) {
+            return Err(PyIndexError::new_err(format!("Block index out of range: {}", b)));
+        }
+
+        let reader = &mut self.reader;
+        let messages = py.allow_threads(|| reader.decode_blocks(&blocks)).map_err(block_error)?;
+        Ok(messages
+            .into_iter()
+            .filter(|m| msg_type.map_or(true, |name| m.name() == name))
+            .map(|message| PyMessage { message })
+            .collect())
+    }
+}
+"""
+
+
+RING_BUFFER_CODE = r"""
+// Single-producer/multi-consumer broadcast ring over caller-provided shared memory
+// (e.g. `multiprocessing.shared_memory.SharedMemory(...).buf`).
+//
+// Control block (native endian atomics), followed by `capacity` bytes of records:
+//
+//   magic: u32 | capacity: u64 @ 8 | claim: u64 @ 16 | write_pos: u64 @ 24 | next_seq: u64 @ 32
+//   generation: u64 @ 40
+//   consumer cursors: RING_MAX_CONSUMERS x u64 @ 64 (cursor + 1, 0 when the slot is free)
+//
+// A record is `seq: u64 | frame`, padded to 8 bytes; frames delimit themselves through the
+// header `msg_size`. A record that would straddle the end of the ring is preceded by a padding
+// marker and written at offset 0. The producer never waits for consumers: it advances `claim`
+// before overwriting, and a consumer that finds `claim` more than `capacity` ahead of its cursor
+// after reading a record knows it was lapped and the record may be torn. Re-creating a ring over
+// memory that already holds one bumps `generation` and keeps the consumer slots, so attached
+// consumers notice the new stream and resync instead of reading it at stale offsets.
+pub const RING_MAGIC: &[u8; 4] = b"XPRB";
+pub const RING_MAX_CONSUMERS: usize = 32;
+pub const RING_HEADER_BYTES: usize = 64 + RING_MAX_CONSUMERS * 8;
+pub const RING_LAPPED: &str = "Ring consumer lapped by producer";
+pub const RING_RESET: &str = "Ring reset by a new producer";
+pub const RING_INVALID_RECORD: &str = "Invalid ring record";
+const RING_CAPACITY_OFFSET: usize = 8;
+const RING_CLAIM_OFFSET: usize = 16;
+const RING_WRITE_OFFSET: usize = 24;
+const RING_SEQ_OFFSET: usize = 32;
+const RING_GENERATION_OFFSET: usize = 40;
+const RING_PADDING: u64 = u64::MAX;
+
+fn align8(n: usize) -> usize {
+    (n + 7) & !7
+}
+
+pub struct Ring {
+    base: *mut u8,
+    capacity: u64,
+}
+
+// The memory behind `base` is owned by whoever created the ring (the Python buffer held next to
+// it in the bindings) and all shared state is accessed through atomics.
+unsafe impl Send for Ring {}
+
+impl Ring {
+    // Initialises a new ring over `len` bytes of zeroed or reused memory
+    pub unsafe fn create(base: *mut u8, len: usize) -> Result<Self, &'static str> {
+        if base as usize % 8 != 0 {
+            return Err("Ring memory must be 8-byte aligned");
+        }
+        if len < RING_HEADER_BYTES + 64 {
+            return Err("Ring memory too small");
+        }
+        let ring = Self {
+            base,
+            capacity: ((len - RING_HEADER_BYTES) & !7) as u64,
+        };
+
+        if ring.magic().load(Ordering::Acquire) == u32::from_le_bytes(*RING_MAGIC) {
+            if ring.atomic(RING_CAPACITY_OFFSET).load(Ordering::Relaxed) != ring.capacity {
+                return Err("Ring memory already holds a ring of a different capacity");
+            }
+            // The generation is bumped before the positions are reset, so a consumer that sees
+            // the new `write_pos` also sees the new generation
+            ring.atomic(RING_GENERATION_OFFSET).fetch_add(1, Ordering::AcqRel);
+            fence(Ordering::Release);
+            ring.atomic(RING_CLAIM_OFFSET).store(0, Ordering::Relaxed);
+            ring.atomic(RING_SEQ_OFFSET).store(0, Ordering::Relaxed);
+            ring.atomic(RING_WRITE_OFFSET).store(0, Ordering::Release);
+            return Ok(ring);
+        }
+
+        std::ptr::write_bytes(base, 0, RING_HEADER_BYTES);
+        ring.atomic(RING_CAPACITY_OFFSET).store(ring.capacity, Ordering::Relaxed);
+        ring.magic().store(u32::from_le_bytes(*RING_MAGIC), Ordering::Release);
+        Ok(ring)
+    }
+
+    // Attaches to a ring created by `Ring::create`, possibly in another process
+    pub unsafe fn attach(base: *mut u8, len: usize) -> Result<Self, &'static str> {
+        if base as usize % 8 != 0 {
+            return Err("Ring memory must be 8-byte aligned");
+        }
+        if len < RING_HEADER_BYTES {
+            return Err("Ring memory too small");
+        }
+
+        let mut ring = Self { base, capacity: 0 };
+        if ring.magic().load(Ordering::Acquire) != u32::from_le_bytes(*RING_MAGIC) {
+            return Err("Not an initialised ring");
+        }
+        ring.capacity = ring.atomic(RING_CAPACITY_OFFSET).load(Ordering::Relaxed);
+        if ring.capacity as usize > len - RING_HEADER_BYTES || ring.capacity % 8 != 0 {
+            return Err("Invalid ring capacity");
+        }
+        Ok(ring)
+    }
+
+    pub fn capacity(&self) -> u64 {
+        self.capacity
+    }
+
+    fn magic(&self) -> &AtomicU32 {
+        unsafe { &*(self.base as *const AtomicU32) }
+    }
+
+    fn atomic(&self, offset: usize) -> &AtomicU64 {
+        unsafe { &*(self.base.add(offset) as *const AtomicU64) }
+    }
+
+    fn consumer_slot(&self, slot: usize) -> &AtomicU64 {
+        self.atomic(64 + slot * 8)
+    }
+
+    fn data(&self) -> *mut u8 {
+        unsafe { self.base.add(RING_HEADER_BYTES) }
+    }
+
+    pub fn write_pos(&self) -> u64 {
+        self.atomic(RING_WRITE_OFFSET).load(Ordering::Acquire)
+    }
+
+    pub fn generation(&self) -> u64 {
+        self.atomic(RING_GENERATION_OFFSET).load(Ordering::Acquire)
+    }
+}
+
+pub struct RingProducer {
+    ring: Ring,
+    next_seq: u64,
+}
+
+impl RingProducer {
+    pub fn new(ring: Ring) -> Self {
+        let next_seq = ring.atomic(RING_SEQ_OFFSET).load(Ordering::Relaxed);
+        Self { ring, next_seq }
+    }
+
+    pub fn next_seq(&self) -> u64 {
+        self.next_seq
+    }
+
+    // Appends one frame and returns its sequence number
+    pub fn publish(&mut self, frame: &[u8]) -> Result<u64, &'static str> {
+        let mut it = frames(frame);
+        match (it.next(), it.next()) {
+            (Some(Ok(_)), None) => {}
+            (Some(Err(e)), _) => return Err(e),
+            _ => return Err("Expected exactly one frame"),
+        }
+
+        let capacity = self.ring.capacity;
+        let record_len = align8(8 + frame.len()) as u64;
+        if record_len > capacity {
+            return Err("Frame too large for ring");
+        }
+
+        let mut pos = self.ring.atomic(RING_WRITE_OFFSET).load(Ordering::Relaxed);
+        let offset = pos % capacity;
+        let padding = if offset + record_len > capacity { capacity - offset } else { 0 };
+        let end = pos + padding + record_len;
+
+        self.ring.atomic(RING_CLAIM_OFFSET).store(end, Ordering::Relaxed);
+        fence(Ordering::Release);
+
+        let seq = self.next_seq;
+        unsafe {
+            let data = self.ring.data();
+            if padding != 0 {
+                std::ptr::write(data.add(offset as usize) as *mut u64, RING_PADDING);
+                pos += padding;
+            }
+            let offset = (pos % capacity) as usize;
+            std::ptr::write(data.add(offset) as *mut u64, seq.to_le());
+            std::ptr::copy_nonoverlapping(frame.as_ptr(), data.add(offset + 8), frame.len());
+        }
+
+        self.next_seq += 1;
+        self.ring.atomic(RING_SEQ_OFFSET).store(self.next_seq, Ordering::Relaxed);
+        self.ring.atomic(RING_WRITE_OFFSET).store(end, Ordering::Release);
+        Ok(seq)
+    }
+
+    // (slot, bytes behind the producer) for every attached consumer; a lag above the
+    // capacity means the consumer has been lapped
+    pub fn consumer_lags(&self) -> Vec<(usize, u64)> {
+        let write_pos = self.ring.write_pos();
+        (0..RING_MAX_CONSUMERS)
+            .filter_map(|slot| match self.ring.consumer_slot(slot).load(Ordering::Acquire) {
+                0 => None,
+                cursor => Some((slot, write_pos.saturating_sub(cursor - 1))),
+            })
+            .collect()
+    }
+}
+
+pub struct RingConsumer {
+    ring: Ring,
+    slot: usize,
+    generation: u64,
+    cursor: u64,
+    next_seq: Option<u64>,
+    missed: u64,
+    overruns: u64,
+}
+
+impl RingConsumer {
+    // Starts at the producer's current position, or at the first record if `from_start`
+    // and the ring has not wrapped yet
+    pub fn new(ring: Ring, from_start: bool) -> Result<Self, &'static str> {
+        let generation = ring.generation();
+        let write_pos = ring.write_pos();
+        let cursor = if from_start {
+            if write_pos > ring.capacity {
+                return Err("Ring has wrapped, cannot start from the first record");
+            }
+            0
+        } else {
+            write_pos
+        };
+
+        let slot = (0..RING_MAX_CONSUMERS)
+            .find(|&slot| {
+                ring.consumer_slot(slot)
+                    .compare_exchange(0, cursor + 1, Ordering::AcqRel, Ordering::Relaxed)
+                    .is_ok()
+            })
+            .ok_or("Too many ring consumers")?;
+
+        Ok(Self {
+            ring,
+            slot,
+            generation,
+            cursor,
+            next_seq: None,
+            missed: 0,
+            overruns: 0,
+        })
+    }
+
+    pub fn lag(&self) -> u64 {
+        self.ring.write_pos().saturating_sub(self.cursor)
+    }
+
+    pub fn missed(&self) -> u64 {
+        self.missed
+    }
+
+    pub fn overruns(&self) -> u64 {
+        self.overruns
+    }
+
+    pub fn next_seq(&self) -> Option<u64> {
+        self.next_seq
+    }
+
+    // Why the bytes at the cursor can no longer be trusted: the ring was re-created, or the
+    // producer has started overwriting the `capacity` bytes after the cursor
+    fn overwritten(&self) -> Option<&'static str> {
+        fence(Ordering::Acquire);
+        if self.ring.atomic(RING_GENERATION_OFFSET).load(Ordering::Relaxed) != self.generation {
+            Some(RING_RESET)
+        } else if self.ring.atomic(RING_CLAIM_OFFSET).load(Ordering::Relaxed) > self.cursor + self.ring.capacity {
+            Some(RING_LAPPED)
+        } else {
+            None
+        }
+    }
+
+    fn resync(&mut self, reason: &'static str) -> &'static str {
+        if reason == RING_RESET {
+            // sequence numbers restart with the new stream
+            self.generation = self.ring.generation();
+            self.next_seq = None;
+        }
+        self.cursor = self.ring.write_pos();
+        self.overruns += 1;
+        self.ring.consumer_slot(self.slot).store(self.cursor + 1, Ordering::Release);
+        reason
+    }
+
+    // Runs `read` on the next frame in place in the ring. Its result is only returned once the
+    // frame is known not to have been overwritten while it was being read.
+    pub fn poll_with<T>(&mut self, read: impl FnOnce(&[u8]) -> T) -> Result<Option<T>, &'static str> {
+        let capacity = self.ring.capacity;
+        loop {
+            if self.ring.generation() != self.generation {
+                return Err(self.resync(RING_RESET));
+            }
+            match self.ring.write_pos().checked_sub(self.cursor) {
+                Some(0) => return Ok(None),
+                Some(behind) if behind <= capacity => {}
+                Some(_) => return Err(self.resync(RING_LAPPED)),
+                None => return Err(self.resync(RING_RESET)),
+            }
+
+            let offset = (self.cursor % capacity) as usize;
+            let record = unsafe { self.ring.data().add(offset) };
+            let seq = u64::from_le(unsafe { std::ptr::read(record as *const u64) });
+            if seq == RING_PADDING {
+                if let Some(reason) = self.overwritten() {
+                    return Err(self.resync(reason));
+                }
+                self.cursor += capacity - offset as u64;
+                continue;
+            }
+
+            let available = capacity as usize - offset - 8;
+            let msg_size = if available >= 9 {
+                let size = unsafe { std::slice::from_raw_parts(record.add(8), 4) };
+                u32::from_be_bytes(*array_ref![size, 0, 4]) as usize
+            } else {
+                0
+            };
+            if msg_size < 9 || msg_size > available {
+                // skip to the newest record rather than failing on this one forever
+                let reason = self.overwritten().unwrap_or(RING_INVALID_RECORD);
+                return Err(self.resync(reason));
+            }
+
+            let value = read(unsafe { std::slice::from_raw_parts(record.add(8), msg_size) });
+            if let Some(reason) = self.overwritten() {
+                return Err(self.resync(reason));
+            }
+
+            if let Some(expected) = self.next_seq {
+                self.missed += seq.saturating_sub(expected);
+            }
+            self.next_seq = Some(seq + 1);
+            self.cursor += align8(8 + msg_size) as u64;
+            self.ring.consumer_slot(self.slot).store(self.cursor + 1, Ordering::Release);
+            return Ok(Some(value));
+        }
+    }
+}
+
+impl Drop for RingConsumer {
+    fn drop(&mut self) {
+        self.ring.consumer_slot(self.slot).store(0, Ordering::Release);
+    }
+}
+
+fn ring_buffer(buffer: &PyAny) -> PyResult<PyBuffer<u8>> {
+    let buffer = PyBuffer::<u8>::get(buffer)?;
+    if buffer.readonly() || !buffer.is_c_contiguous() {
+        return Err(PyValueError::new_err("Ring memory must be a writable contiguous buffer"));
+    }
+    Ok(buffer)
+}
+
+#[pyclass]
+struct PyRingProducer {
+    // declared before `buffer` so it is dropped while the memory is still exported
+    producer: Option<RingProducer>,
+    buffer: Option<PyBuffer<u8>>,
+}
+
+#[pymethods]
+impl PyRingProducer {
+    #[new]
+    fn new(buffer: &PyAny) -> PyResult<Self> {
+        let buffer = ring_buffer(buffer)?;
+        let ring = unsafe { Ring::create(buffer.buf_ptr() as *mut u8, buffer.len_bytes()) }
+            .map_err(PyValueError::new_err)?;
+        Ok(Self {
+            producer: Some(RingProducer::new(ring)),
+            buffer: Some(buffer),
+        })
+    }
+
+    // Size of the shared memory needed for a ring with `capacity` bytes of records
+    #[staticmethod]
+    fn required_size(capacity: usize) -> usize {
+        RING_HEADER_BYTES + align8(capacity)
+    }
+
+    fn publish(&mut self, frame: &[u8]) -> PyResult<u64> {
+        self.producer_mut()?.publish(frame).map_err(PyValueError::new_err)
+    }
+
+    fn publish_message(&mut self, message: PyRef<PyMessage>) -> PyResult<u64> {
+        let frame = message.message.serialize();
+        self.producer_mut()?.publish(&frame).map_err(PyValueError::new_err)
+    }
+
+    // Publishes every frame of a buffer of concatenated frames, returning how many were published
+    fn publish_frames(&mut self, buffer: &[u8]) -> PyResult<usize> {
+        let producer = self.producer_mut()?;
+        let mut count = 0;
+        for frame in frames(buffer) {
+            producer
+                .publish(frame.map_err(PyValueError::new_err)?)
+                .map_err(PyValueError::new_err)?;
+            count += 1;
+        }
+        Ok(count)
+    }
+
+    #[getter]
+    fn next_seq(&self) -> PyResult<u64> {
+        Ok(self.producer()?.next_seq())
+    }
+
+    fn consumer_lags(&self) -> PyResult<Vec<(usize, u64)>> {
+        Ok(self.producer()?.consumer_lags())
+    }
+
+    fn close(&mut self, py: Python) {
+        self.producer = None;
+        if let Some(buffer) = self.buffer.take() {
+            buffer.release(py);
+        }
+    }
+}
+
+impl PyRingProducer {
+    fn producer(&self) -> PyResult<&RingProducer> {
+        self.producer
+            .as_ref()
+            .ok_or_else(|| PyValueError::new_err("Ring producer is closed"))
+    }
+
+    fn producer_mut(&mut self) -> PyResult<&mut RingProducer> {
+        self.producer
+            .as_mut()
+            .ok_or_else(|| PyValueError::new_err("Ring producer is closed"))
+    }
+}
+
+#[pyclass]
+struct PyRingConsumer {
+    // declared before `buffer` so its cursor slot is released while the memory is still exported
+    consumer: Option<RingConsumer>,
+    buffer: Option<PyBuffer<u8>>,
+    pending_error: Option<&'static str>,
+}
+
+#[pymethods]
+impl PyRingConsumer {
+    #[new]
+    #[pyo3(signature = (buffer, from_start=false))]
+    fn new(buffer: &PyAny, from_start: bool) -> PyResult<Self> {
+        let buffer = ring_buffer(buffer)?;
+        let ring = unsafe { Ring::attach(buffer.buf_ptr() as *mut u8, buffer.len_bytes()) }
+            .map_err(PyValueError::new_err)?;
+        Ok(Self {
+            consumer: Some(RingConsumer::new(ring, from_start).map_err(PyValueError::new_err)?),
+            buffer: Some(buffer),
+            pending_error: None,
+        })
+    }
+
+    // Next message decoded in place from the ring, or None if the consumer is caught up
+    fn poll(&mut self) -> PyResult<Option<PyMessage>> {
+        self.take_pending_error()?;
+        match self.consumer_mut()?.poll_with(Message::deserialize) {
+            Ok(Some(message)) => Ok(Some(PyMessage {
+                message: message.map_err(PyValueError::new_err)?,
+            })),
+            Ok(None) => Ok(None),
+            Err(e) => Err(PyValueError::new_err(e)),
+        }
+    }
+
+    fn poll_bytes(&mut self, py: Python) -> PyResult<Option<PyObject>> {
+        self.take_pending_error()?;
+        self.consumer_mut()?
+            .poll_with(|frame| -> PyObject { PyBytes::new(py, frame).into() })
+            .map_err(PyValueError::new_err)
+    }
+
+    // Up to `max_frames` messages. If the consumer is lapped after some messages were read,
+    // they are returned and the error is raised by the next poll.
+    #[pyo3(signature = (max_frames=1024))]
+    fn poll_batch(&mut self, max_frames: usize) -> PyResult<Vec<PyMessage>> {
+        self.take_pending_error()?;
+        let consumer = self.consumer_mut()?;
+        let mut messages = Vec::new();
+        let mut error = None;
+        while messages.len() < max_frames {
+            match consumer.poll_with(Message::deserialize) {
+                Ok(Some(Ok(message))) => messages.push(PyMessage { message }),
+                Ok(Some(Err(e))) | Err(e) => {
+                    error = Some(e);
+                    break;
+                }
+                Ok(None) => break,
+            }
+        }
+        match error {
+            Some(e) if messages.is_empty() => Err(PyValueError::new_err(e)),
+            Some(e) => {
+                self.pending_error = Some(e);
+                Ok(messages)
+            }
+            None => Ok(messages),
+        }
+    }
+
+    // Bytes published but not yet consumed
+    #[getter]
+    fn lag(&self) -> PyResult<u64> {
+        Ok(self.consumer()?.lag())
+    }
+
+    // Frames skipped because the consumer was lapped
+    #[getter]
+    fn missed(&self) -> PyResult<u64> {
+        Ok(self.consumer()?.missed())
+    }
+
+    #[getter]
+    fn overruns(&self) -> PyResult<u64> {
+        Ok(self.consumer()?.overruns())
+    }
+
+    #[getter]
+    fn next_seq(&self) -> PyResult<Option<u64>> {
+        Ok(self.consumer()?.next_seq())
+    }
+
+    fn close(&mut self, py: Python) {
+        self.consumer = None;
+        if let Some(buffer) = self.buffer.take() {
+            buffer.release(py);
+        }
+    }
+}
+
+impl PyRingConsumer {
+    fn consumer(&self) -> PyResult<&RingConsumer> {
+        self.consumer
+            .as_ref()
+            .ok_or_else(|| PyValueError::new_err("Ring consumer is closed"))
+    }
+
+    fn consumer_mut(&mut self) -> PyResult<&mut RingConsumer> {
+        self.consumer
+            .as_mut()
+            .ok_or_else(|| PyValueError::new_err("Ring consumer is closed"))
+    }
+
+    fn take_pending_error(&mut self) -> PyResult<()> {
+        match self.pending_error.take() {
+            Some(e) => Err(PyValueError::new_err(e)),
+            None => Ok(()),
+        }
+    }
+}
+"""
+
+
+FIELD_ACCESS_CODE = r"""
+#[derive(Clone, Copy, PartialEq, Debug)]
+pub enum FieldKind {
+    Int,
+    UInt,
+    Float,
+    Bool,
+    Str,
+    Enum,
+}
+
+#[derive(Debug)]
+pub struct FieldSpec {
+    pub name: &'static str,
+    pub kind: FieldKind,
+    pub size: usize,
+    pub optional_bit: Option<u32>,
+}
+
+#[derive(Debug)]
+pub struct MessageSpec {
+    pub name: &'static str,
+    pub msg_type: u8,
+    pub max_payload_size: usize,
+    pub fields: &'static [FieldSpec],
+}
+
+// A single decoded field. `str` fields have their right padding stripped.
+#[derive(Clone, PartialEq, PartialOrd, Debug)]
+pub enum FieldValue {
+    Int(i128),
+    UInt(u128),
+    Float(f64),
+    Bool(bool),
+    Str(String),
+    Enum(u8),
+}
+
+// Floats are never used as keys, so comparing their bits is enough to make FieldValue hashable
+impl Eq for FieldValue {}
+
+impl std::hash::Hash for FieldValue {
+    fn hash<H: std::hash::Hasher>(&self, state: &mut H) {
+        std::mem::discriminant(self).hash(state);
+        match self {
+            FieldValue::Int(v) => v.hash(state),
+            FieldValue::UInt(v) => v.hash(state),
+            FieldValue::Float(v) => v.to_bits().hash(state),
+            FieldValue::Bool(v) => v.hash(state),
+            FieldValue::Str(v) => v.hash(state),
+            FieldValue::Enum(v) => v.hash(state),
+        }
+    }
+}
+
+impl ToPyObject for FieldValue {
+    fn to_object(&self, py: Python) -> PyObject {
+        match self {
+            FieldValue::Int(v) => v.to_object(py),
+            FieldValue::UInt(v) => v.to_object(py),
+            FieldValue::Float(v) => v.to_object(py),
+            FieldValue::Bool(v) => v.to_object(py),
+            FieldValue::Str(v) => v.to_object(py),
+            FieldValue::Enum(v) => v.to_object(py),
+        }
+    }
+}
+
+impl MessageSpec {
+    pub fn by_name(name: &str) -> Option<&'static MessageSpec> {
+        MESSAGE_SPECS.iter().find(|spec| spec.name == name)
+    }
+
+    pub fn by_msg_type(msg_type: u8) -> Option<&'static MessageSpec> {
+        MESSAGE_SPECS.iter().find(|spec| spec.msg_type == msg_type)
+    }
+
+    pub fn field_index(&self, name: &str) -> Option<usize> {
+        self.fields.iter().position(|field| field.name == name)
+    }
+
+    // Byte range of field `index` within a frame of this format, or None if it is an absent optional
+    pub fn field_range(&self, frame: &[u8], index: usize) -> Result<Option<std::ops::Range<usize>>, &'static str> {
+        if frame.len() < 9 {
+            return Err("Buffer too short for header");
+        }
+        let header = Header::from_bytes(array_ref![frame, 0, 9]);
+        if header.msg_type != self.msg_type {
+            return Err("Frame is not of the expected message format");
+        }
+
+        let present = |field: &FieldSpec| field.optional_bit.map_or(true, |bit| header.bitmask & (1 << bit) != 0);
+        let offset: usize = 9 + self.fields[..index]
+            .iter()
+            .filter(|field| present(field))
+            .map(|field| field.size)
+            .sum::<usize>();
+
+        let field = &self.fields[index];
+        if !present(field) {
+            return Ok(None);
+        }
+        if offset + field.size > frame.len().min(header.msg_size as usize) {
+            return Err("Invalid buffer: field out of range");
+        }
+        Ok(Some(offset..offset + field.size))
+    }
+
+    // Decodes field `index` from a frame of this format without decoding the other fields
+    pub fn read_field(&self, frame: &[u8], index: usize) -> Result<Option<FieldValue>, &'static str> {
+        let range = match self.field_range(frame, index)? {
+            Some(range) => range,
+            None => return Ok(None),
+        };
+        let bytes = &frame[range];
+
+        let value = match self.fields[index].kind {
+            FieldKind::Int => {
+                let fill = if bytes[0] & 0x80 != 0 { 0xff } else { 0 };
+                let mut be = [fill; 16];
+                be[16 - bytes.len()..].copy_from_slice(bytes);
+                FieldValue::Int(i128::from_be_bytes(be))
+            }
+            FieldKind::UInt => {
+                let mut be = [0u8; 16];
+                be[16 - bytes.len()..].copy_from_slice(bytes);
+                FieldValue::UInt(u128::from_be_bytes(be))
+            }
+            FieldKind::Float => match bytes.len() {
+                4 => FieldValue::Float(f32::from_be_bytes(*array_ref![bytes, 0, 4]) as f64),
+                8 => FieldValue::Float(f64::from_be_bytes(*array_ref![bytes, 0, 8])),
+                _ => return Err("Unsupported float width"),
+            },
+            FieldKind::Bool => FieldValue::Bool(bytes[0] != 0),
+            FieldKind::Str => {
+                let end = bytes.iter().rposition(|&b| b != b' ').map_or(0, |i| i + 1);
+                FieldValue::Str(bytes[..end].iter().map(|&b| b as char).collect())
+            }
+            FieldKind::Enum => FieldValue::Enum(bytes[0]),
+        };
+        Ok(Some(value))
+    }
+}
+"""
+
+AGGREGATION_CODE = r"""
+#[derive(Clone, Copy, PartialEq, Debug)]
+pub enum AggregateOp {
+    Count,
+    Sum,
+    Min,
+    Max,
+    Mean,
+    First,
+    Last,
+    WeightedMean,
+}
+
+impl AggregateOp {
+    pub fn from_name(name: &str) -> Result<Self, &'static str> {
+        match name {
+            "count" => Ok(AggregateOp::Count),
+            "sum" => Ok(AggregateOp::Sum),
+            "min" => Ok(AggregateOp::Min),
+            "max" => Ok(AggregateOp::Max),
+            "mean" => Ok(AggregateOp::Mean),
+            "first" => Ok(AggregateOp::First),
+            "last" => Ok(AggregateOp::Last),
+            "wmean" => Ok(AggregateOp::WeightedMean),
+            _ => Err("Unknown aggregate"),
+        }
+    }
+
+    pub fn name(&self) -> &'static str {
+        match self {
+            AggregateOp::Count => "count",
+            AggregateOp::Sum => "sum",
+            AggregateOp::Min => "min",
+            AggregateOp::Max => "max",
+            AggregateOp::Mean => "mean",
+            AggregateOp::First => "first",
+            AggregateOp::Last => "last",
+            AggregateOp::WeightedMean => "wmean",
+        }
+    }
+}
+
+// Running state of one aggregate for one group; absent optional values are skipped
+#[derive(Clone, Debug)]
+enum Accumulator {
+    Count(u64),
+    SumInt(i128),
+    SumFloat(f64),
+    Mean(f64, u64),
+    WeightedMean(f64, f64),
+    Value(Option<FieldValue>),
+}
+
+impl Accumulator {
+    fn new(op: AggregateOp, kind: Option<FieldKind>) -> Self {
+        match (op, kind) {
+            (AggregateOp::Count, _) => Accumulator::Count(0),
+            (AggregateOp::Sum, Some(FieldKind::Float)) => Accumulator::SumFloat(0.0),
+            (AggregateOp::Sum, _) => Accumulator::SumInt(0),
+            (AggregateOp::Mean, _) => Accumulator::Mean(0.0, 0),
+            (AggregateOp::WeightedMean, _) => Accumulator::WeightedMean(0.0, 0.0),
+            _ => Accumulator::Value(None),
+        }
+    }
+
+    // `weight` is only used by wmean
+    fn update(&mut self, op: AggregateOp, value: FieldValue, weight: f64) {
+        match self {
+            Accumulator::Count(n) => *n += 1,
+            Accumulator::SumInt(sum) => *sum = sum.wrapping_add(as_i128(&value)),
+            Accumulator::SumFloat(sum) => *sum += as_f64(&value),
+            Accumulator::Mean(sum, n) => {
+                *sum += as_f64(&value);
+                *n += 1;
+            }
+            Accumulator::WeightedMean(sum, total_weight) => {
+                *sum += as_f64(&value) * weight;
+                *total_weight += weight;
+            }
+            Accumulator::Value(current) => {
+                let replace = match (op, &*current) {
+                    (_, None) => true,
+                    (AggregateOp::Min, Some(v)) => value < *v,
+                    (AggregateOp::Max, Some(v)) => value > *v,
+                    (AggregateOp::Last, Some(_)) => true,
+                    _ => false,
+                };
+                if replace {
+                    *current = Some(value);
+                }
+            }
+        }
+    }
+
+    fn result(&self) -> Option<FieldValue> {
+        match self {
+            Accumulator::Count(n) => Some(FieldValue::UInt(*n as u128)),
+            Accumulator::SumInt(sum) => Some(FieldValue::Int(*sum)),
+            Accumulator::SumFloat(sum) => Some(FieldValue::Float(*sum)),
+            Accumulator::Mean(_, 0) => None,
+            Accumulator::Mean(sum, n) => Some(FieldValue::Float(*sum / *n as f64)),
+            Accumulator::WeightedMean(_, total_weight) if *total_weight == 0.0 => None,
+            Accumulator::WeightedMean(sum, total_weight) => Some(FieldValue::Float(*sum / *total_weight)),
+            Accumulator::Value(value) => value.clone(),
+        }
+    }
+}
+
+fn as_i128(value: &FieldValue) -> i128 {
+    match value {
+        FieldValue::Int(v) => *v,
+        FieldValue::UInt(v) => *v as i128,
+        FieldValue::Bool(v) => *v as i128,
+        FieldValue::Float(v) => *v as i128,
+        FieldValue::Enum(v) => *v as i128,
+        FieldValue::Str(_) => 0,
+    }
+}
+
+fn as_f64(value: &FieldValue) -> f64 {
+    match value {
+        FieldValue::Float(v) => *v,
+        other => as_i128(other) as f64,
+    }
+}
+
+pub type GroupKey = Vec<Option<FieldValue>>;
+
+// Group-by aggregation over frames of one message format, reading only the fields involved.
+// Memory is one key and one accumulator per aggregate for each group; groups keep first-seen order.
+pub struct Aggregator {
+    spec: &'static MessageSpec,
+    keys: Vec<usize>,
+    aggregates: Vec<(AggregateOp, Option<usize>, Option<usize>)>,
+    groups: Vec<(GroupKey, Vec<Accumulator>)>,
+    group_index: std::collections::HashMap<GroupKey, usize>,
+}
+
+impl Aggregator {
+    // `aggregates` are (op, field, weight) triples; a `count` without a field counts frames and
+    // `wmean` averages `field` weighted by `weight` (e.g. VWAP: ("wmean", "price", "quantity"))
+    pub fn new(
+        message_format: &str,
+        keys: &[&str],
+        aggregates: &[(&str, Option<&str>, Option<&str>)],
+    ) -> Result<Self, &'static str> {
+        let spec = MessageSpec::by_name(message_format).ok_or("Unknown message format")?;
+
+        let mut key_indices = Vec::with_capacity(keys.len());
+        for key in keys {
+            let index = spec.field_index(key).ok_or("Unknown group key attribute")?;
+            if spec.fields[index].kind == FieldKind::Float {
+                return Err("Cannot group by a float attribute");
+            }
+            key_indices.push(index);
+        }
+
+        let mut resolved = Vec::with_capacity(aggregates.len());
+        for (op, field, weight) in aggregates {
+            let op = AggregateOp::from_name(op)?;
+            let index = match field {
+                Some(field) => Some(spec.field_index(field).ok_or("Unknown aggregate attribute")?),
+                None if op == AggregateOp::Count => None,
+                None => return Err("Aggregate requires an attribute"),
+            };
+            let weight = match weight {
+                Some(weight) if op == AggregateOp::WeightedMean => {
+                    Some(spec.field_index(weight).ok_or("Unknown weight attribute")?)
+                }
+                Some(_) => return Err("Only wmean takes a weight attribute"),
+                None if op == AggregateOp::WeightedMean => return Err("wmean requires a weight attribute"),
+                None => None,
+            };
+            let numeric = |index: Option<usize>| !matches!(index.map(|i| spec.fields[i].kind), Some(FieldKind::Str) | Some(FieldKind::Enum));
+            if matches!(op, AggregateOp::Sum | AggregateOp::Mean | AggregateOp::WeightedMean) && !(numeric(index) && numeric(weight)) {
+                return Err("Cannot sum or average a str or enum attribute");
+            }
+            resolved.push((op, index, weight));
+        }
+
+        Ok(Self {
+            spec,
+            keys: key_indices,
+            aggregates: resolved,
+            groups: Vec::new(),
+            group_index: std::collections::HashMap::new(),
+        })
+    }
+
+    pub fn columns(&self) -> Vec<String> {
+        let mut columns: Vec<String> = self.keys.iter().map(|&i| self.spec.fields[i].name.to_string()).collect();
+        for (op, field, weight) in &self.aggregates {
+            columns.push(match (field, weight) {
+                (Some(i), Some(w)) => format!("{}_{}_{}", op.name(), self.spec.fields[*i].name, self.spec.fields[*w].name),
+                (Some(i), None) => format!("{}_{}", op.name(), self.spec.fields[*i].name),
+                _ => op.name().to_string(),
+            });
+        }
+        columns
+    }
+
+    // Frames of other message formats are ignored
+    pub fn update(&mut self, frame: &[u8]) -> Result<(), &'static str> {
+        if frame.len() < 9 {
+            return Err("Buffer too short for header");
+        }
+        if frame[4] != self.spec.msg_type {
+            return Ok(());
+        }
+
+        let mut key = Vec::with_capacity(self.keys.len());
+        for &index in &self.keys {
+            key.push(self.spec.read_field(frame, index)?);
+        }
+
+        let group = match self.group_index.get(&key) {
+            Some(&group) => group,
+            None => {
+                let spec = self.spec;
+                let accumulators = self
+                    .aggregates
+                    .iter()
+                    .map(|(op, field, _)| Accumulator::new(*op, field.map(|i| spec.fields[i].kind)))
+                    .collect();
+                self.groups.push((key.clone(), accumulators));
+                self.group_index.insert(key, self.groups.len() - 1);
+                self.groups.len() - 1
+            }
+        };
+
+        for (i, &(op, field, weight)) in self.aggregates.iter().enumerate() {
+            let value = match field {
+                Some(index) => match self.spec.read_field(frame, index)? {
+                    Some(value) => value,
+                    None => continue,
+                },
+                None => FieldValue::UInt(1),
+            };
+            let weight = match weight {
+                Some(index) => match self.spec.read_field(frame, index)? {
+                    Some(weight) => as_f64(&weight),
+                    None => continue,
+                },
+                None => 1.0,
+            };
+            self.groups[group].1[i].update(op, value, weight);
+        }
+        Ok(())
+    }
+
+    pub fn update_frames(&mut self, buffer: &[u8]) -> Result<(), &'static str> {
+        for frame in frames(buffer) {
+            self.update(frame?)?;
+        }
+        Ok(())
+    }
+
+    pub fn update_reader<R: Read>(&mut self, reader: R) -> io::Result<()> {
+        let mut reader = FrameReader::new(reader);
+        while let Some(frame) = reader.next_frame()? {
+            self.update(frame).map_err(invalid_data)?;
+        }
+        Ok(())
+    }
+
+    // One row per group: key values followed by aggregate results, None where nothing was aggregated
+    pub fn rows(&self) -> Vec<Vec<Option<FieldValue>>> {
+        self.groups
+            .iter()
+            .map(|(key, accumulators)| {
+                key.iter()
+                    .cloned()
+                    .chain(accumulators.iter().map(|acc| acc.result()))
+                    .collect()
+            })
+            .collect()
+    }
+}
+
+// (op, field) or (op, field, weight) from Python
+#[derive(FromPyObject)]
+enum AggregateArg<'a> {
+    Weighted(&'a str, &'a str, &'a str),
+    Plain(&'a str, Option<&'a str>),
+}
+
+#[pyclass]
+struct PyAggregator {
+    aggregator: Aggregator,
+}
+
+#[pymethods]
+impl PyAggregator {
+    #[new]
+    fn new(message_format: &str, group_by: Vec<&str>, aggregates: Vec<AggregateArg>) -> PyResult<Self> {
+        let aggregates: Vec<_> = aggregates
+            .into_iter()
+            .map(|aggregate| match aggregate {
+                AggregateArg::Weighted(op, field, weight) => (op, Some(field), Some(weight)),
+                AggregateArg::Plain(op, field) => (op, field, None),
+            })
+            .collect();
+        Ok(Self {
+            aggregator: Aggregator::new(message_format, &group_by, &aggregates).map_err(PyValueError::new_err)?,
+        })
+    }
+
+    #[getter]
+    fn columns(&self) -> Vec<String> {
+        self.aggregator.columns()
+    }
+
+    fn __len__(&self) -> usize {
+        self.aggregator.groups.len()
+    }
+
+    fn update(&mut self, frame: &[u8]) -> PyResult<()> {
+        self.aggregator.update(frame).map_err(PyValueError::new_err)
+    }
+
+    fn update_frames(&mut self, py: Python, buffer: &[u8]) -> PyResult<()> {
+        let aggregator = &mut self.aggregator;
+        py.allow_threads(|| aggregator.update_frames(buffer))
+            .map_err(PyValueError::new_err)
+    }
+
+    // Streams a capture file of concatenated frames
+    fn update_file(&mut self, py: Python, path: &str) -> PyResult<()> {
+        let file = File::open(path)?;
+        let aggregator = &mut self.aggregator;
+        Ok(py.allow_threads(|| aggregator.update_reader(BufReader::with_capacity(1 << 16, file)))?)
+    }
+
+    fn result(&self, py: Python) -> Vec<PyObject> {
+        self.aggregator
+            .rows()
+            .iter()
+            .map(|row| PyTuple::new(py, row.iter().map(|value| value.to_object(py))).into())
+            .collect()
+    }
+}
+"""
+
+
+SNAPSHOT_CACHE_CODE = r"""
+const NIL: usize = usize::MAX;
+
+// Latest encoded frame per key for one message format. Frames live in fixed-size slots
+// (header + max payload) of a single arena and are only decoded on lookup. Slots are kept in
+// a least-recently-used list so the cache can be bounded by `max_entries`.
+pub struct SnapshotCache {
+    spec: &'static MessageSpec,
+    keys: Vec<usize>,
+    max_entries: Option<usize>,
+    slot_size: usize,
+    arena: Vec<u8>,
+    frame_lens: Vec<usize>,
+    slot_keys: Vec<GroupKey>,
+    index: std::collections::HashMap<GroupKey, usize>,
+    prev: Vec<usize>,
+    next: Vec<usize>,
+    free: Vec<usize>,
+    head: usize,
+    tail: usize,
+    evictions: u64,
+}
+
+impl SnapshotCache {
+    pub fn new(message_format: &str, keys: &[&str], max_entries: Option<usize>) -> Result<Self, &'static str> {
+        let spec = MessageSpec::by_name(message_format).ok_or("Unknown message format")?;
+        if keys.is_empty() {
+            return Err("At least one key attribute is required");
+        }
+        if max_entries == Some(0) {
+            return Err("max_entries must be positive");
+        }
+
+        let mut key_indices = Vec::with_capacity(keys.len());
+        for key in keys {
+            let index = spec.field_index(key).ok_or("Unknown key attribute")?;
+            if spec.fields[index].kind == FieldKind::Float {
+                return Err("Cannot key by a float attribute");
+            }
+            key_indices.push(index);
+        }
+
+        Ok(Self {
+            spec,
+            keys: key_indices,
+            max_entries,
+            slot_size: 9 + spec.max_payload_size,
+            arena: Vec::new(),
+            frame_lens: Vec::new(),
+            slot_keys: Vec::new(),
+            index: std::collections::HashMap::new(),
+            prev: Vec::new(),
+            next: Vec::new(),
+            free: Vec::new(),
+            head: NIL,
+            tail: NIL,
+            evictions: 0,
+        })
+    }
+
+    pub fn spec(&self) -> &'static MessageSpec {
+        self.spec
+    }
+
+    pub fn key_kinds(&self) -> Vec<FieldKind> {
+        self.keys.iter().map(|&i| self.spec.fields[i].kind).collect()
+    }
+
+    pub fn len(&self) -> usize {
+        self.index.len()
+    }
+
+    pub fn evictions(&self) -> u64 {
+        self.evictions
+    }
+
+    fn unlink(&mut self, slot: usize) {
+        let (prev, next) = (self.prev[slot], self.next[slot]);
+        match prev {
+            NIL => self.head = next,
+            prev => self.next[prev] = next,
+        }
+        match next {
+            NIL => self.tail = prev,
+            next => self.prev[next] = prev,
+        }
+    }
+
+    fn push_front(&mut self, slot: usize) {
+        self.prev[slot] = NIL;
+        self.next[slot] = self.head;
+        match self.head {
+            NIL => self.tail = slot,
+            head => self.prev[head] = slot,
+        }
+        self.head = slot;
+    }
+
+    fn touch(&mut self, slot: usize) {
+        if self.head != slot {
+            self.unlink(slot);
+            self.push_front(slot);
+        }
+    }
+
+    fn allocate(&mut self, key: GroupKey) -> usize {
+        let slot = if let Some(slot) = self.free.pop() {
+            slot
+        } else if self.max_entries.map_or(false, |max| self.index.len() >= max) {
+            let slot = self.tail;
+            self.unlink(slot);
+            self.index.remove(&self.slot_keys[slot]);
+            self.evictions += 1;
+            slot
+        } else {
+            self.arena.resize(self.arena.len() + self.slot_size, 0);
+            self.frame_lens.push(0);
+            self.slot_keys.push(Vec::new());
+            self.prev.push(NIL);
+            self.next.push(NIL);
+            self.frame_lens.len() - 1
+        };
+
+        self.slot_keys[slot] = key.clone();
+        self.index.insert(key, slot);
+        self.push_front(slot);
+        slot
+    }
+
+    // Stores `frame` as the latest value for its key; returns false for frames of other formats
+    pub fn ingest(&mut self, frame: &[u8]) -> Result<bool, &'static str> {
+        let mut it = frames(frame);
+        match (it.next(), it.next()) {
+            (Some(Ok(_)), None) => {}
+            (Some(Err(e)), _) => return Err(e),
+            _ => return Err("Expected exactly one frame"),
+        }
+        if frame[4] != self.spec.msg_type {
+            return Ok(false);
+        }
+        if frame.len() > self.slot_size {
+            return Err("Invalid buffer: msg_size");
+        }
+
+        let mut key = Vec::with_capacity(self.keys.len());
+        for &index in &self.keys {
+            key.push(self.spec.read_field(frame, index)?);
+        }
+
+        let slot = match self.index.get(&key) {
+            Some(&slot) => {
+                self.touch(slot);
+                slot
+            }
+            None => self.allocate(key),
+        };
+        let start = slot * self.slot_size;
+        self.arena[start..start + frame.len()].copy_from_slice(frame);
+        self.frame_lens[slot] = frame.len();
+        Ok(true)
+    }
+
+    pub fn ingest_frames(&mut self, buffer: &[u8]) -> Result<usize, &'static str> {
+        let mut stored = 0;
+        for frame in frames(buffer) {
+            if self.ingest(frame?)? {
+                stored += 1;
+            }
+        }
+        Ok(stored)
+    }
+
+    fn frame(&self, slot: usize) -> &[u8] {
+        let start = slot * self.slot_size;
+        &self.arena[start..start + self.frame_lens[slot]]
+    }
+
+    // Latest frame for `key`, marking it as recently used
+    pub fn get(&mut self, key: &GroupKey) -> Option<&[u8]> {
+        let slot = *self.index.get(key)?;
+        self.touch(slot);
+        Some(self.frame(slot))
+    }
+
+    pub fn contains(&self, key: &GroupKey) -> bool {
+        self.index.contains_key(key)
+    }
+
+    pub fn remove(&mut self, key: &GroupKey) -> bool {
+        match self.index.remove(key) {
+            Some(slot) => {
+                self.unlink(slot);
+                self.free.push(slot);
+                true
+            }
+            None => false,
+        }
+    }
+
+    // (key, frame) pairs from most to least recently used
+    pub fn entries(&self) -> Vec<(&GroupKey, &[u8])> {
+        let mut entries = Vec::with_capacity(self.len());
+        let mut slot = self.head;
+        while slot != NIL {
+            entries.push((&self.slot_keys[slot], self.frame(slot)));
+            slot = self.next[slot];
+        }
+        entries
+    }
+
+    // All latest frames concatenated, most recently used first
+    pub fn snapshot(&self) -> Vec<u8> {
+        let mut buffer = Vec::with_capacity(self.len() * self.slot_size);
+        for (_, frame) in self.entries() {
+            buffer.extend_from_slice(frame);
+        }
+        buffer
+    }
+}
+
+// Converts a Python key (a tuple, or a bare value for a single key attribute) to a GroupKey
+fn extract_key(key: &PyAny, kinds: &[FieldKind]) -> PyResult<GroupKey> {
+    let values: Vec<&PyAny> = match key.downcast::<PyTuple>() {
+        Ok(tuple) => tuple.iter().collect(),
+        Err(_) => vec![key],
+    };
+    if values.len() != kinds.len() {
+        return Err(PyValueError::new_err(format!("Expected a key of {} values", kinds.len())));
+    }
+
+    values
+        .iter()
+        .zip(kinds)
+        .map(|(value, kind)| {
+            if value.is_none() {
+                return Ok(None);
+            }
+            Ok(Some(match kind {
+                FieldKind::Int => FieldValue::Int(value.extract()?),
+                FieldKind::UInt => FieldValue::UInt(value.extract()?),
+                FieldKind::Float => FieldValue::Float(value.extract()?),
+                FieldKind::Bool => FieldValue::Bool(value.extract()?),
+                FieldKind::Str => FieldValue::Str(value.extract::<&str>()?.trim_end_matches(' ').to_string()),
+                FieldKind::Enum => FieldValue::Enum(value.extract()?),
+            }))
+        })
+        .collect()
+}
+
+#[pyclass]
+struct PySnapshotCache {
+    cache: SnapshotCache,
+}
+
+#[pymethods]
+impl PySnapshotCache {
+    #[new]
+    #[pyo3(signature = (message_format, keys, max_entries=None))]
+    fn new(message_format: &str, keys: Vec<&str>, max_entries: Option<usize>) -> PyResult<Self> {
+        Ok(Self {
+            cache: SnapshotCache::new(message_format, &keys, max_entries).map_err(PyValueError::new_err)?,
+        })
+    }
+
+    fn __len__(&self) -> usize {
+        self.cache.len()
+    }
+
+    fn __contains__(&self, key: &PyAny) -> PyResult<bool> {
+        Ok(self.cache.contains(&extract_key(key, &self.cache.key_kinds())?))
+    }
+
+    #[getter]
+    fn evictions(&self) -> u64 {
+        self.cache.evictions()
+    }
+
+    fn ingest(&mut self, frame: &[u8]) -> PyResult<bool> {
+        self.cache.ingest(frame).map_err(PyValueError::new_err)
+    }
+
+    fn ingest_frames(&mut self, py: Python, buffer: &[u8]) -> PyResult<usize> {
+        let cache = &mut self.cache;
+        py.allow_threads(|| cache.ingest_frames(buffer))
+            .map_err(PyValueError::new_err)
+    }
+
+    fn get(&mut self, key: &PyAny) -> PyResult<Option<PyMessage>> {
+        let key = extract_key(key, &self.cache.key_kinds())?;
+        match self.cache.get(&key) {
+            Some(frame) => Ok(Some(PyMessage {
+                message: Message::deserialize(frame).map_err(PyValueError::new_err)?,
+            })),
+            None => Ok(None),
+        }
+    }
+
+    fn get_bytes(&mut self, py: Python, key: &PyAny) -> PyResult<Option<PyObject>> {
+        let key = extract_key(key, &self.cache.key_kinds())?;
+        Ok(self.cache.get(&key).map(|frame| PyBytes::new(py, frame).into()))
+    }
+
+    fn remove(&mut self, key: &PyAny) -> PyResult<bool> {
+        Ok(self.cache.remove(&extract_key(key, &self.cache.key_kinds())?))
+    }
+
+    // Keys from most to least recently used
+    fn keys(&self, py: Python) -> Vec<PyObject> {
+        self.cache
+            .entries()
+            .iter()
+            .map(|(key, _)| PyTuple::new(py, key.iter().map(|value| value.to_object(py))).into())
+            .collect()
+    }
+
+    // Latest frame of every key, concatenated
+    fn snapshot(&self, py: Python) -> PyObject {
+        PyBytes::new(py, &self.cache.snapshot()).into()
+    }
+}
+"""
+
 
-        [
-            size_bytes[0],
-            size_bytes[1],
-            size_bytes[2],
-            size_bytes[3],
-            self.msg_type,
-            mask_bytes[0],
-            mask_bytes[1],
-            mask_bytes[2],
-            mask_bytes[3],
-        ]
+RECORD_EXPORT_CODE = r"""
+// Python objects created once per message format and shared by every record conversion
+struct FormatObjects {
+    type_name: String,
+    field_names: Vec<Py<PyString>>,
+    // built on first use, so a failing namedtuple never affects tuple or dict export
+    namedtuple: GILOnceCell<PyObject>,
+}
+
+impl FormatObjects {
+    fn to_dict(&self, py: Python, values: Vec<PyObject>) -> PyResult<PyObject> {
+        let dict = PyDict::new(py);
+        for (name, value) in self.field_names.iter().zip(values) {
+            dict.set_item(name.as_ref(py), value)?;
+        }
+        Ok(dict.into())
     }
 
-    pub fn from_bytes(buffer: &[u8; 9]) -> Self {
-        let msg_size = u32::from_be_bytes([buffer[0], buffer[1], buffer[2], buffer[3]]);
-        let msg_type = buffer[4];
-        let bitmask = u32::from_be_bytes([buffer[5], buffer[6], buffer[7], buffer[8]]);
+    fn to_namedtuple(&self, py: Python, values: Vec<PyObject>) -> PyResult<PyObject> {
+        let namedtuple = self.namedtuple.get_or_try_init(py, || -> PyResult<PyObject> {
+            // rename=True replaces attribute names namedtuple rejects (keywords, leading underscore)
+            let kwargs = PyDict::new(py);
+            kwargs.set_item("rename", true)?;
+            let fields: Vec<&PyString> = self.field_names.iter().map(|name| name.as_ref(py)).collect();
+            Ok(py
+                .import("collections")?
+                .getattr("namedtuple")?
+                .call((self.type_name.as_str(), fields), Some(kwargs))?
+                .into())
+        })?;
+        Ok(namedtuple.call1(py, PyTuple::new(py, values))?)
+    }
+}
 
-        Self {
-            msg_size,
-            msg_type,
-            bitmask,
+static FORMAT_OBJECTS: GILOnceCell<Vec<FormatObjects>> = GILOnceCell::new();
+
+// Indexed by msg_type - 1, like MESSAGE_SPECS
+fn format_objects(py: Python) -> &'static Vec<FormatObjects> {
+    FORMAT_OBJECTS.get_or_init(py, || {
+        MESSAGE_SPECS
+            .iter()
+            .map(|spec| {
+                let mut type_name = spec.name.to_string();
+                type_name[..1].make_ascii_uppercase();
+                FormatObjects {
+                    type_name,
+                    field_names: spec.fields.iter().map(|field| PyString::intern(py, field.name).into()).collect(),
+                    namedtuple: GILOnceCell::new(),
+                }
+            })
+            .collect()
+    })
+}
+
+// Decodes every frame of `buffer` and builds one record per frame with `make_record`
+fn batch_to_records(
+    py: Python,
+    buffer: &[u8],
+    make_record: impl Fn(&FormatObjects, Vec<PyObject>) -> PyResult<PyObject>,
+    enum_names: bool,
+) -> PyResult<Vec<PyObject>> {
+    let objects = format_objects(py);
+    let mut records = Vec::new();
+    for frame in frames(buffer) {
+        let message = Message::deserialize(frame.map_err(PyValueError::new_err)?).map_err(PyValueError::new_err)?;
+        let values = message.field_objects(py, enum_names);
+        records.push(make_record(&objects[message.msg_type() as usize - 1], values)?);
+    }
+    Ok(records)
+}
+"""
+
+
+MERGE_CODE = r"""
+struct MergeEntry {
+    key: Option<FieldValue>,
+    source: usize,
+    frame: Vec<u8>,
+}
+
+// Reversed so that BinaryHeap pops the smallest key first, ties going to the earliest source
+impl Ord for MergeEntry {
+    fn cmp(&self, other: &Self) -> std::cmp::Ordering {
+        other
+            .key
+            .partial_cmp(&self.key)
+            .unwrap_or(std::cmp::Ordering::Equal)
+            .then_with(|| other.source.cmp(&self.source))
+    }
+}
+
+impl PartialOrd for MergeEntry {
+    fn partial_cmp(&self, other: &Self) -> Option<std::cmp::Ordering> {
+        Some(self.cmp(other))
+    }
+}
+
+impl PartialEq for MergeEntry {
+    fn eq(&self, other: &Self) -> bool {
+        self.cmp(other) == std::cmp::Ordering::Equal
+    }
+}
+
+impl Eq for MergeEntry {}
+
+// Kind all keys are compared as when the key attribute's kind differs across formats:
+// int and uint keys compare as int, and either compares as float against a float key
+fn merge_key_kind(a: FieldKind, b: FieldKind) -> Result<FieldKind, &'static str> {
+    match (a, b) {
+        (a, b) if a == b => Ok(a),
+        (FieldKind::Float, FieldKind::Int | FieldKind::UInt) | (FieldKind::Int | FieldKind::UInt, FieldKind::Float) => {
+            Ok(FieldKind::Float)
+        }
+        (FieldKind::Int, FieldKind::UInt) | (FieldKind::UInt, FieldKind::Int) => Ok(FieldKind::Int),
+        _ => Err("Sort key attribute has incompatible types across message formats"),
+    }
+}
+
+// Sort key of a frame, converted to `kind`. None if its format lacks the key attribute or it
+// is an absent optional.
+fn merge_key(key_indices: &[Option<usize>], kind: FieldKind, frame: &[u8]) -> Result<Option<FieldValue>, &'static str> {
+    let spec = MessageSpec::by_msg_type(frame[4]).ok_or("Unknown message type id")?;
+    let index = match key_indices[spec.msg_type as usize - 1] {
+        Some(index) => index,
+        None => return Ok(None),
+    };
+    Ok(spec.read_field(frame, index)?.map(|value| match (kind, value) {
+        (FieldKind::Float, value @ (FieldValue::Int(_) | FieldValue::UInt(_))) => FieldValue::Float(as_f64(&value)),
+        (FieldKind::Int, FieldValue::UInt(v)) => FieldValue::Int(i128::try_from(v).unwrap_or(i128::MAX)),
+        (_, value) => value,
+    }))
+}
+
+// k-way merge of inputs that are each ordered by one attribute. Only one frame per input is
+// held at a time; how far each input reads ahead is up to its reader (e.g. a BufReader capacity).
+// Frames without a key value keep the key of the previous frame of their input, so they stay
+// where they were relative to it; before any keyed frame they sort first.
+pub struct FrameMerger<R: Read> {
+    readers: Vec<FrameReader<R>>,
+    key_indices: Vec<Option<usize>>,
+    key_kind: FieldKind,
+    last_keys: Vec<Option<FieldValue>>,
+    heap: std::collections::BinaryHeap<MergeEntry>,
+    started: bool,
+}
+
+impl<R: Read> FrameMerger<R> {
+    pub fn new(readers: Vec<R>, key: &str) -> Result<Self, &'static str> {
+        let key_indices: Vec<Option<usize>> = MESSAGE_SPECS.iter().map(|spec| spec.field_index(key)).collect();
+        let mut key_kind = None;
+        for (spec, index) in MESSAGE_SPECS.iter().zip(&key_indices) {
+            if let Some(index) = index {
+                let kind = spec.fields[*index].kind;
+                key_kind = Some(match key_kind {
+                    Some(current) => merge_key_kind(current, kind)?,
+                    None => kind,
+                });
+            }
+        }
+
+        Ok(Self {
+            heap: std::collections::BinaryHeap::with_capacity(readers.len()),
+            last_keys: vec![None; readers.len()],
+            readers: readers.into_iter().map(FrameReader::new).collect(),
+            key_indices,
+            key_kind: key_kind.ok_or("Unknown sort key attribute")?,
+            started: false,
+        })
+    }
+
+    fn advance(&mut self, source: usize) -> io::Result<()> {
+        if let Some(frame) = self.readers[source].next_frame()? {
+            if frame.len() < 9 {
+                return Err(invalid_data("Buffer too short for header"));
+            }
+            let key = match merge_key(&self.key_indices, self.key_kind, frame).map_err(invalid_data)? {
+                Some(key) => Some(key),
+                None => self.last_keys[source].clone(),
+            };
+            self.last_keys[source] = key.clone();
+            self.heap.push(MergeEntry {
+                key,
+                source,
+                frame: frame.to_vec(),
+            });
+        }
+        Ok(())
+    }
+
+    pub fn next_frame(&mut self) -> io::Result<Option<Vec<u8>>> {
+        if !self.started {
+            self.started = true;
+            for source in 0..self.readers.len() {
+                self.advance(source)?;
+            }
+        }
+
+        match self.heap.pop() {
+            Some(entry) => {
+                self.advance(entry.source)?;
+                Ok(Some(entry.frame))
+            }
+            None => Ok(None),
         }
     }
 }
 
 #[pyclass]
-struct PyMessage {
-    message: Message,
+struct PyMergeIterator {
+    merger: FrameMerger<Box<dyn Read + Send>>,
+    decode: bool,
 }
 
-#[pymodule]
-fn xparse(_py: Python, m: &PyModule) -> PyResult<()> {
-    m.add_class::<PyMessage>()?;
-    Ok(())
+#[pymethods]
+impl PyMergeIterator {
+    // `sources` are capture file paths or bytes of concatenated frames
+    #[new]
+    #[pyo3(signature = (sources, key, decode=false, read_ahead=65536))]
+    fn new(sources: Vec<&PyAny>, key: &str, decode: bool, read_ahead: usize) -> PyResult<Self> {
+        let mut readers: Vec<Box<dyn Read + Send>> = Vec::with_capacity(sources.len());
+        for source in sources {
+            match source.downcast::<PyBytes>() {
+                Ok(bytes) => readers.push(Box::new(io::Cursor::new(bytes.as_bytes().to_vec()))),
+                Err(_) => {
+                    let path: std::path::PathBuf = source.extract()?;
+                    readers.push(Box::new(BufReader::with_capacity(read_ahead.max(9), File::open(path)?)));
+                }
+            }
+        }
+
+        Ok(Self {
+            merger: FrameMerger::new(readers, key).map_err(PyValueError::new_err)?,
+            decode,
+        })
+    }
+
+    fn __iter__(slf: PyRef<'_, Self>) -> PyRef<'_, Self> {
+        slf
+    }
+
+    fn __next__(&mut self, py: Python) -> PyResult<Option<PyObject>> {
+        let frame = match self.merger.next_frame()? {
+            Some(frame) => frame,
+            None => return Ok(None),
+        };
+        if self.decode {
+            let message = Message::deserialize(&frame).map_err(PyValueError::new_err)?;
+            Ok(Some(PyMessage { message }.into_py(py)))
+        } else {
+            Ok(Some(PyBytes::new(py, &frame).into()))
+        }
+    }
+}
+"""
+
+
+STR_INTERNING_CODE = r"""
+pub const DEFAULT_INTERN_CAPACITY: usize = 8192;
+
+// Bounded cache of Python str objects for fixed-width str fields, keyed by the raw padded bytes.
+// Full caches evict with CLOCK: the hand skips (and clears) entries hit since it last passed them.
+struct StrInterner {
+    capacity: usize,
+    index: std::collections::HashMap<Box<[u8]>, usize>,
+    entries: Vec<(Box<[u8]>, Py<PyString>, bool)>,
+    hand: usize,
+    scratch: Vec<u8>,
+    hits: u64,
+    misses: u64,
+    evictions: u64,
+}
+
+impl StrInterner {
+    fn new(capacity: usize) -> Self {
+        Self {
+            capacity,
+            index: std::collections::HashMap::new(),
+            entries: Vec::new(),
+            hand: 0,
+            scratch: Vec::new(),
+            hits: 0,
+            misses: 0,
+            evictions: 0,
+        }
+    }
+
+    fn intern(&mut self, py: Python, chars: &[char]) -> PyObject {
+        self.scratch.clear();
+        self.scratch.extend(chars.iter().map(|&c| c as u8));
+        if let Some(&i) = self.index.get(&self.scratch[..]) {
+            self.hits += 1;
+            self.entries[i].2 = true;
+            return self.entries[i].1.clone_ref(py).into();
+        }
+
+        self.misses += 1;
+        let value: Py<PyString> = PyString::new(py, &char_array_to_string(chars)).into();
+        if self.capacity == 0 {
+            return value.into();
+        }
+
+        let key: Box<[u8]> = self.scratch.as_slice().into();
+        let slot = if self.entries.len() < self.capacity {
+            self.entries.push((key.clone(), value.clone_ref(py), false));
+            self.entries.len() - 1
+        } else {
+            while self.entries[self.hand].2 {
+                self.entries[self.hand].2 = false;
+                self.hand = (self.hand + 1) % self.entries.len();
+            }
+            let slot = self.hand;
+            self.hand = (self.hand + 1) % self.entries.len();
+            self.index.remove(&self.entries[slot].0);
+            self.entries[slot] = (key.clone(), value.clone_ref(py), false);
+            self.evictions += 1;
+            slot
+        };
+        self.index.insert(key, slot);
+        value.into()
+    }
+
+    fn clear(&mut self) {
+        self.index.clear();
+        self.entries.clear();
+        self.hand = 0;
+    }
+}
+
+static STR_INTERNER: GILProtected<RefCell<Option<StrInterner>>> = GILProtected::new(RefCell::new(None));
+
+fn with_str_interner<T>(py: Python, f: impl FnOnce(&mut StrInterner) -> T) -> T {
+    let mut interner = STR_INTERNER.get(py).borrow_mut();
+    f(interner.get_or_insert_with(|| StrInterner::new(DEFAULT_INTERN_CAPACITY)))
+}
+
+fn intern_str(py: Python, chars: &[char]) -> PyObject {
+    with_str_interner(py, |interner| interner.intern(py, chars))
 }
 """
 
@@ -246,6 +2565,8 @@ def generate_rust_code_for_schema(schema) -> str:
         code += f"""\t\tif buffer.len() < 9 {{\n\t\t\treturn Err("Buffer too short for header");\n\t\t}}\n\n"""
 
         code += f"""\t\tlet header = Header::from_bytes(array_ref![buffer, 0, 9]);\n"""
+        code += f"""\t\tif header.msg_size as usize > buffer.len() || header.msg_size as usize != 9 + Self::payload_size(header.bitmask) {{\n"""
+        code += f"""\t\t\treturn Err("Invalid buffer: msg_size");\n\t\t}}\n\n"""
         code += f"""\t\tlet mut offset = 9;\n\n"""
 
         ok_code = f"""\t\tOk(Self {{\n"""
@@ -357,6 +2678,13 @@ def generate_rust_code_for_schema(schema) -> str:
         code += f"""\t\t}}\n"""
         code += f"""\t}}\n\n"""
 
+        code += f"""\tpub fn name(&self) -> &'static str {{\n"""
+        code += f"""\t\tmatch self {{\n"""
+        for variant_name in enums_schema[enum_name]:
+            code += f"""\t\t\t{enum_name.capitalize()}::{variant_name.capitalize()} => "{variant_name}",\n"""
+        code += f"""\t\t}}\n"""
+        code += f"""\t}}\n\n"""
+
         code += f"""}}\n\n"""
 
     for message_format in message_formats_schema:
@@ -383,6 +2711,23 @@ def generate_rust_code_for_schema(schema) -> str:
         # end max_payload_size
         code += "\n    }\n\n"
 
+        # begin payload_size - size of the payload for the optional fields present in the bitmask
+        optional_sizes = [
+            get_rust_num_bytes(rt) for _, rt in attribute_rust_types if rt.startswith("Option<")
+        ]
+        required_size = total_payload_size - sum(optional_sizes)
+        if optional_sizes:
+            code += f"""\tfn payload_size(bitmask: u32) -> usize {{\n"""
+            code += f"""\t\tlet mut size = {required_size};\n"""
+            for i, n in enumerate(optional_sizes):
+                code += f"""\t\tif bitmask & (1 << {i}) != 0 {{\n\t\t\tsize += {n};\n\t\t}}\n"""
+            code += f"""\t\tsize\n"""
+        else:
+            code += f"""\tfn payload_size(_bitmask: u32) -> usize {{\n"""
+            code += f"""\t\t{required_size}\n"""
+        # end payload_size
+        code += f"""\t}}\n\n"""
+
         # begin serialize
         code += f"""\tfn serialize(&self) -> Vec<u8> {{\n"""
         code += f"""\t\tlet mut buf: Vec<u8> = Vec::with_capacity({name}::max_payload_size());\n\n"""
@@ -472,8 +2817,118 @@ def generate_rust_code_for_schema(schema) -> str:
     # end Message::deserialize
     code += f"""\t}}\n\n"""
 
+    # Message::msg_type
+    code += f"""\tpub fn msg_type(&self) -> u8 {{\n"""
+    code += f"""\t\tmatch self {{\n"""
+    for i, message_format in enumerate(message_formats_schema):
+        code += f"""\t\t\tMessage::{message_format['name'].capitalize()}(_) => {i+1},\n"""
+    code += f"""\t\t}}\n"""
+    code += f"""\t}}\n\n"""
+
+    # Message::name
+    code += f"""\tpub fn name(&self) -> &'static str {{\n"""
+    code += f"""\t\tmatch self {{\n"""
+    for message_format in message_formats_schema:
+        code += f"""\t\t\tMessage::{message_format['name'].capitalize()}(_) => "{message_format['name']}",\n"""
+    code += f"""\t\t}}\n"""
+    code += f"""\t}}\n\n"""
+
+    # Message::msg_type_from_name
+    code += f"""\tpub fn msg_type_from_name(name: &str) -> Option<u8> {{\n"""
+    code += f"""\t\tmatch name {{\n"""
+    for i, message_format in enumerate(message_formats_schema):
+        code += f"""\t\t\t"{message_format['name']}" => Some({i+1}),\n"""
+    code += f"""\t\t\t_ => None,\n"""
+    code += f"""\t\t}}\n"""
+    code += f"""\t}}\n\n"""
+
     # end Message impl
-    code += f"""}}"""
+    code += f"""}}\n\n"""
+
+    # MESSAGE_SPECS - field layout of every message format, used to read single fields from frames
+    field_kinds = {
+        "int": "Int",
+        "uint": "UInt",
+        "float": "Float",
+        "bool": "Bool",
+        "str": "Str",
+    }
+    code += f"""pub static MESSAGE_SPECS: &[MessageSpec] = &[\n"""
+    for i, message_format in enumerate(message_formats_schema):
+        max_payload_size = 0
+        code += f"""\tMessageSpec {{\n"""
+        code += f"""\t\tname: "{message_format['name']}",\n"""
+        code += f"""\t\tmsg_type: {i+1},\n"""
+        fields_code = ""
+        opt_cnt = 0
+        for attribute in message_format["attributes"]:
+            rust_type = get_rust_type(attribute)
+            size = get_rust_num_bytes(rust_type)
+            max_payload_size += size
+            if rust_type.startswith("Option<"):
+                optional_bit = f"Some({opt_cnt})"
+                opt_cnt += 1
+            else:
+                optional_bit = "None"
+            kind = field_kinds.get(attribute["type"], "Enum")
+            fields_code += f"""\t\t\tFieldSpec {{ name: "{attribute['name']}", kind: FieldKind::{kind}, size: {size}, optional_bit: {optional_bit} }},\n"""
+        code += f"""\t\tmax_payload_size: {max_payload_size},\n"""
+        code += f"""\t\tfields: &[\n{fields_code}\t\t],\n"""
+        code += f"""\t}},\n"""
+    code += f"""];\n\n"""
+    max_frame_size = 9 + max(
+        sum(get_rust_num_bytes(get_rust_type(attribute)) for attribute in message_format["attributes"])
+        for message_format in message_formats_schema
+    )
+    code += f"""pub const MAX_FRAME_SIZE: usize = {max_frame_size};\n\n"""
+
+    # Enum::py_object - value and name objects of every variant, created once
+    for enum_name in enums_schema:
+        variants = list(enums_schema[enum_name].items())
+        enum_type = enum_name.capitalize()
+        code += f"""impl {enum_type} {{\n"""
+        code += f"""\tfn py_object(&self, py: Python, enum_names: bool) -> PyObject {{\n"""
+        code += f"""\t\tstatic OBJECTS: GILOnceCell<[(PyObject, PyObject); {len(variants)}]> = GILOnceCell::new();\n"""
+        code += f"""\t\tlet objects = OBJECTS.get_or_init(py, || [\n"""
+        for variant_name, variant_value in variants:
+            code += f"""\t\t\t({int(variant_value)}u8.to_object(py), PyString::intern(py, "{variant_name}").into()),\n"""
+        code += f"""\t\t]);\n"""
+        code += f"""\t\tlet (value, name) = &objects[match self {{\n"""
+        for i, (variant_name, _) in enumerate(variants):
+            code += f"""\t\t\t{enum_type}::{variant_name.capitalize()} => {i},\n"""
+        code += f"""\t\t}}];\n"""
+        code += f"""\t\tif enum_names {{ name.clone_ref(py) }} else {{ value.clone_ref(py) }}\n"""
+        code += f"""\t}}\n"""
+        code += f"""}}\n\n"""
+
+    # Message::field_objects - attribute values as Python objects, in schema order
+    code += f"""impl Message {{\n"""
+    code += f"""\tfn field_objects(&self, py: Python, enum_names: bool) -> Vec<PyObject> {{\n"""
+    code += f"""\t\tmatch self {{\n"""
+    for message_format in message_formats_schema:
+        code += f"""\t\t\tMessage::{message_format['name'].capitalize()}(m) => vec![\n"""
+        for attribute in message_format["attributes"]:
+            att_name = attribute["name"]
+            rust_type = get_rust_type(attribute)
+            optional = rust_type.startswith("Option<")
+            inner_rust_type = rust_type[rust_type.index("<") + 1 : -1] if optional else rust_type
+            if inner_rust_type.startswith("[char;"):
+                if optional:
+                    value = f"m.{att_name}.as_ref().map_or_else(|| py.None(), |chars| intern_str(py, chars))"
+                else:
+                    value = f"intern_str(py, &m.{att_name})"
+            elif inner_rust_type.lower() in enums_schema:
+                if optional:
+                    value = f"m.{att_name}.as_ref().map_or_else(|| py.None(), |v| v.py_object(py, enum_names))"
+                else:
+                    value = f"m.{att_name}.py_object(py, enum_names)"
+            else:
+                value = f"m.{att_name}.to_object(py)"
+            code += f"""\t\t\t\t{value},\n"""
+        code += f"""\t\t\t],\n"""
+    code += f"""\t\t}}\n"""
+    code += f"""\t}}\n"""
+    code += f"""}}\n\n"""
 
     # begin PyMessage impl
     code += r"""#[pymethods]
@@ -502,6 +2957,79 @@ impl PyMessage {
         Ok(self.message == other.message)
     }
 
+    #[getter]
+    fn format_name(&self) -> &'static str {
+        self.message.name()
+    }
+
+    #[pyo3(signature = (enum_names=false))]
+    fn to_tuple(&self, py: Python, enum_names: bool) -> PyObject {
+        PyTuple::new(py, self.message.field_objects(py, enum_names)).into()
+    }
+
+    #[pyo3(signature = (enum_names=false))]
+    fn to_dict(&self, py: Python, enum_names: bool) -> PyResult<PyObject> {
+        let objects = &format_objects(py)[self.message.msg_type() as usize - 1];
+        objects.to_dict(py, self.message.field_objects(py, enum_names))
+    }
+
+    #[pyo3(signature = (enum_names=false))]
+    fn to_namedtuple(&self, py: Python, enum_names: bool) -> PyResult<PyObject> {
+        let objects = &format_objects(py)[self.message.msg_type() as usize - 1];
+        objects.to_namedtuple(py, self.message.field_objects(py, enum_names))
+    }
+
+    #[staticmethod]
+    #[pyo3(signature = (buffer, enum_names=false))]
+    fn batch_to_tuples(py: Python, buffer: &[u8], enum_names: bool) -> PyResult<Vec<PyObject>> {
+        batch_to_records(py, buffer, |_, values| Ok(PyTuple::new(py, values).into()), enum_names)
+    }
+
+    #[staticmethod]
+    #[pyo3(signature = (buffer, enum_names=false))]
+    fn batch_to_dicts(py: Python, buffer: &[u8], enum_names: bool) -> PyResult<Vec<PyObject>> {
+        batch_to_records(py, buffer, |objects, values| objects.to_dict(py, values), enum_names)
+    }
+
+    // Hit/miss counters and size of the cache of str field values
+    #[staticmethod]
+    fn intern_stats(py: Python) -> std::collections::HashMap<&'static str, u64> {
+        with_str_interner(py, |interner| {
+            std::collections::HashMap::from([
+                ("hits", interner.hits),
+                ("misses", interner.misses),
+                ("evictions", interner.evictions),
+                ("size", interner.entries.len() as u64),
+                ("capacity", interner.capacity as u64),
+            ])
+        })
+    }
+
+    // Sets how many distinct str values are cached (0 disables interning); clears the cache
+    #[staticmethod]
+    fn set_intern_capacity(py: Python, capacity: usize) {
+        with_str_interner(py, |interner| {
+            interner.clear();
+            interner.capacity = capacity;
+        })
+    }
+
+    #[staticmethod]
+    fn clear_intern_cache(py: Python) {
+        with_str_interner(py, |interner| {
+            interner.clear();
+            interner.hits = 0;
+            interner.misses = 0;
+            interner.evictions = 0;
+        })
+    }
+
+    #[staticmethod]
+    #[pyo3(signature = (buffer, enum_names=false))]
+    fn batch_to_namedtuples(py: Python, buffer: &[u8], enum_names: bool) -> PyResult<Vec<PyObject>> {
+        batch_to_records(py, buffer, |objects, values| objects.to_namedtuple(py, values), enum_names)
+    }
+
 """
     # message format specific constructors
     for message_format in message_formats_schema:
@@ -610,6 +3138,15 @@ impl PyMessage {
     # end PyMessage impl
     code += f"""}}\n\n"""
 
+    code += BLOCK_CONTAINER_CODE
+    code += RING_BUFFER_CODE
+    code += FIELD_ACCESS_CODE
+    code += AGGREGATION_CODE
+    code += SNAPSHOT_CACHE_CODE
+    code += RECORD_EXPORT_CODE
+    code += MERGE_CODE
+    code += STR_INTERNING_CODE
+
     # begin tests
     code += r"""#[cfg(test)]
 mod tests {
@@ -656,6 +3193,309 @@ mod tests {
 
         code += f"""\t}}\n\n"""
 
+    code += f"""\tfn example_frames() -> Vec<Vec<u8>> {{\n"""
+    code += f"""\t\tvec![\n"""
+    for message_format in message_formats_schema:
+        name = message_format["name"].capitalize()
+        code += f"""\t\t\tMessage::{name}({name}::get_example()).serialize(),\n"""
+    code += f"""\t\t]\n"""
+    code += f"""\t}}\n\n"""
+
+    code += r"""    #[test]
+    fn test_block_container_roundtrip() {
+        let frames = example_frames();
+        let mut writer = BlockWriter::new(std::io::Cursor::new(Vec::new()), 2, Codec::Zlib).unwrap();
+        for _ in 0..5 {
+            for frame in &frames {
+                writer.push_frame(frame).unwrap();
+            }
+        }
+        let container = writer.finish().unwrap();
+
+        let mut reader = BlockReader::new(container).unwrap();
+        let n_frames = 5 * frames.len();
+        assert_eq!(reader.index().len(), (n_frames + 1) / 2);
+        assert_eq!(reader.index().iter().map(|b| b.frame_count as usize).sum::<usize>(), n_frames);
+        assert_eq!(reader.read_block(0).unwrap(), [frames[0].clone(), frames[1 % frames.len()].clone()].concat());
+
+        let all_blocks: Vec<usize> = (0..reader.index().len()).collect();
+        let messages = reader.decode_blocks(&all_blocks).unwrap();
+        assert_eq!(messages.len(), n_frames);
+        for (i, message) in messages.iter().enumerate() {
+            assert_eq!(message.serialize(), frames[i % frames.len()]);
+        }
+
+        for block in reader.blocks_with_msg_type(1) {
+            assert!(reader.index()[block].msg_type_counts.iter().any(|&(t, n)| t == 1 && n > 0));
+        }
+    }
+
+    #[test]
+    fn test_block_container_rejects_corrupt_input() {
+        let frame = example_frames()[0].clone();
+        let mut writer = BlockWriter::new(std::io::Cursor::new(Vec::new()), 2, Codec::Zlib).unwrap();
+        let mut unknown = frame.clone();
+        unknown[4] = 0;
+        assert_eq!(writer.push_frame(&unknown).unwrap_err().kind(), io::ErrorKind::InvalidData);
+        writer.push_frame(&frame).unwrap();
+        let container = writer.finish().unwrap().into_inner();
+
+        let index_offset = u64::from_be_bytes(*array_ref![container, container.len() - 12, 8]) as usize;
+        // block count, then the first entry's raw_len
+        for at in [index_offset, index_offset + 4 + 12] {
+            let mut corrupt = container.clone();
+            corrupt[at..at + 4].copy_from_slice(&u32::MAX.to_be_bytes());
+            let err = BlockReader::new(std::io::Cursor::new(corrupt)).err().unwrap();
+            assert_eq!(err.kind(), io::ErrorKind::InvalidData);
+        }
+    }
+
+    #[test]
+    fn test_read_field_example_values() {
+        for spec in MESSAGE_SPECS {
+            let frame = example_frames()[spec.msg_type as usize - 1].clone();
+            for (index, field) in spec.fields.iter().enumerate() {
+                let value = spec.read_field(&frame, index).unwrap().unwrap();
+                match field.kind {
+                    FieldKind::Int => assert_eq!(value, FieldValue::Int(-123)),
+                    FieldKind::UInt => assert_eq!(value, FieldValue::UInt(123)),
+                    FieldKind::Float => assert!(matches!(value, FieldValue::Float(v) if (v - 3.14).abs() < 1e-6)),
+                    FieldKind::Bool => assert_eq!(value, FieldValue::Bool(true)),
+                    FieldKind::Str => assert_eq!(value, FieldValue::Str("John Doe".to_string())),
+                    FieldKind::Enum => assert!(matches!(value, FieldValue::Enum(_))),
+                }
+            }
+        }
+    }
+
+    #[test]
+    fn test_aggregator_group_by() {
+        let spec = &MESSAGE_SPECS[0];
+        let key = spec.fields.iter().find(|f| f.kind != FieldKind::Float).unwrap().name;
+        let frame = example_frames()[0].clone();
+
+        let mut aggregator = Aggregator::new(spec.name, &[key], &[("count", None, None), ("last", Some(key), None)]).unwrap();
+        for _ in 0..3 {
+            aggregator.update_frames(&example_frames().concat()).unwrap();
+        }
+        aggregator.update_reader(std::io::Cursor::new(frame.clone())).unwrap();
+
+        let rows = aggregator.rows();
+        assert_eq!(rows.len(), 1);
+        assert_eq!(rows[0][1], Some(FieldValue::UInt(4)));
+        assert_eq!(rows[0][0], rows[0][2]);
+        assert_eq!(aggregator.columns(), vec![key.to_string(), "count".to_string(), format!("last_{}", key)]);
+        assert!(Aggregator::new(spec.name, &["no_such_attribute"], &[]).is_err());
+        assert!(Aggregator::new(spec.name, &[key], &[("wmean", Some(key), None)]).is_err());
+        assert!(Aggregator::new(spec.name, &[key], &[("mean", Some(key), Some(key))]).is_err());
+    }
+
+    #[test]
+    fn test_weighted_mean() {
+        let mut vwap = Accumulator::new(AggregateOp::WeightedMean, Some(FieldKind::Float));
+        assert_eq!(vwap.result(), None);
+        vwap.update(AggregateOp::WeightedMean, FieldValue::Float(10.0), 1.0);
+        vwap.update(AggregateOp::WeightedMean, FieldValue::Float(20.0), 3.0);
+        assert_eq!(vwap.result(), Some(FieldValue::Float(17.5)));
+    }
+
+    #[test]
+    fn test_frame_reader_rejects_oversized_frames() {
+        let mut frame = example_frames()[0].clone();
+        frame[..4].copy_from_slice(&u32::MAX.to_be_bytes());
+        let mut reader = FrameReader::new(std::io::Cursor::new(frame));
+        assert_eq!(reader.next_frame().unwrap_err().kind(), io::ErrorKind::InvalidData);
+    }
+
+    #[test]
+    fn test_snapshot_cache_latest_value_and_eviction() {
+        let spec = &MESSAGE_SPECS[0];
+        let key_index = spec.fields.iter().position(|f| f.kind != FieldKind::Float).unwrap();
+        let frame = example_frames()[0].clone();
+        let key = vec![spec.read_field(&frame, key_index).unwrap()];
+
+        let mut cache = SnapshotCache::new(spec.name, &[spec.fields[key_index].name], Some(1)).unwrap();
+        assert_eq!(cache.ingest_frames(&example_frames().concat()).unwrap(), 1);
+        assert!(cache.ingest(&frame).unwrap());
+        assert_eq!(cache.len(), 1);
+        assert_eq!(cache.get(&key), Some(&frame[..]));
+        assert_eq!(cache.snapshot(), frame);
+
+        // a frame with a different key evicts the only entry
+        let mut other = frame.clone();
+        let range = spec.field_range(&other, key_index).unwrap().unwrap();
+        other[range.end - 1] ^= 1;
+        assert!(cache.ingest(&other).unwrap());
+        assert_eq!(cache.len(), 1);
+        assert_eq!(cache.evictions(), 1);
+        assert_eq!(cache.get(&key), None);
+
+        assert!(cache.remove(&vec![spec.read_field(&other, key_index).unwrap()]));
+        assert_eq!(cache.len(), 0);
+        assert!(cache.ingest(&frame).unwrap());
+        assert_eq!(cache.entries().len(), 1);
+
+        // only whole single frames are stored
+        assert!(cache.ingest(&frame[..frame.len() - 1]).is_err());
+        assert!(cache.ingest(&[&frame[..], &[0]].concat()).is_err());
+        assert_eq!(cache.get(&key), Some(&frame[..]));
+    }
+
+    #[test]
+    fn test_merge_orders_by_key() {
+        let spec = &MESSAGE_SPECS[0];
+        let key_index = match spec
+            .fields
+            .iter()
+            .position(|f| matches!(f.kind, FieldKind::Int | FieldKind::UInt | FieldKind::Str))
+        {
+            Some(index) => index,
+            None => return,
+        };
+        let with_key = |low_byte: u8| {
+            let mut frame = example_frames()[0].clone();
+            let range = spec.field_range(&frame, key_index).unwrap().unwrap();
+            frame[range.end - 1] = low_byte;
+            frame
+        };
+        let even: Vec<u8> = [0, 2, 4].iter().flat_map(|&b| with_key(b)).collect();
+        let odd: Vec<u8> = [1, 3, 5].iter().flat_map(|&b| with_key(b)).collect();
+
+        let mut merger = FrameMerger::new(vec![std::io::Cursor::new(even), std::io::Cursor::new(odd)], spec.fields[key_index].name).unwrap();
+        let mut merged = Vec::new();
+        while let Some(frame) = merger.next_frame().unwrap() {
+            merged.push(frame);
+        }
+        assert_eq!(merged, (0..6).map(with_key).collect::<Vec<_>>());
+        assert!(FrameMerger::new(Vec::<std::io::Cursor<Vec<u8>>>::new(), "no_such_attribute").is_err());
+
+        // a frame of a format without the key attribute follows its predecessor in the same input
+        let key = spec.fields[key_index].name;
+        if let Some(other_spec) = MESSAGE_SPECS.iter().find(|other| other.field_index(key).is_none()) {
+            let other = example_frames()[other_spec.msg_type as usize - 1].clone();
+            let mixed: Vec<u8> = [with_key(0), other.clone(), with_key(2), with_key(4)].concat();
+            let odd: Vec<u8> = [1, 3, 5].iter().flat_map(|&b| with_key(b)).collect();
+            let mut merger = FrameMerger::new(vec![std::io::Cursor::new(odd), std::io::Cursor::new(mixed)], key).unwrap();
+            let mut merged = Vec::new();
+            while let Some(frame) = merger.next_frame().unwrap() {
+                merged.push(frame);
+            }
+            let mut expected: Vec<Vec<u8>> = (0..6).map(with_key).collect();
+            expected.insert(1, other);
+            assert_eq!(merged, expected);
+        }
+    }
+
+    #[test]
+    fn test_merge_compares_int_and_uint_keys_by_value() {
+        // an attribute that is int in one format and uint in another, e.g. quantity
+        let pair = MESSAGE_SPECS.iter().flat_map(|a| a.fields.iter().map(move |f| (a, f))).find_map(|(a, field)| {
+            let b = MESSAGE_SPECS.iter().find(|b| {
+                b.field_index(field.name)
+                    .map_or(false, |i| field.kind == FieldKind::UInt && b.fields[i].kind == FieldKind::Int)
+            })?;
+            Some((a, b, field.name))
+        });
+        let (uint_spec, int_spec, key) = match pair {
+            Some(pair) => pair,
+            None => return,
+        };
+
+        // uint key 123 from the example, int key 200
+        let uint_frame = example_frames()[uint_spec.msg_type as usize - 1].clone();
+        let mut int_frame = example_frames()[int_spec.msg_type as usize - 1].clone();
+        let range = int_spec.field_range(&int_frame, int_spec.field_index(key).unwrap()).unwrap().unwrap();
+        int_frame[range.clone()].fill(0);
+        int_frame[range.end - 1] = 200;
+
+        let mut merger = FrameMerger::new(vec![std::io::Cursor::new(int_frame.clone()), std::io::Cursor::new(uint_frame.clone())], key).unwrap();
+        assert_eq!(merger.next_frame().unwrap(), Some(uint_frame));
+        assert_eq!(merger.next_frame().unwrap(), Some(int_frame));
+    }
+
+    #[test]
+    fn test_ring_wrap_around_and_lapping() {
+        let frames = example_frames();
+        let capacity = 4 * align8(8 + frames.iter().map(|f| f.len()).max().unwrap());
+        let mut memory = vec![0u64; (RING_HEADER_BYTES + capacity) / 8];
+        let (base, len) = (memory.as_mut_ptr() as *mut u8, memory.len() * 8);
+
+        let mut producer = RingProducer::new(unsafe { Ring::create(base, len) }.unwrap());
+        let mut fast = RingConsumer::new(unsafe { Ring::attach(base, len) }.unwrap(), true).unwrap();
+        let mut slow = RingConsumer::new(unsafe { Ring::attach(base, len) }.unwrap(), true).unwrap();
+
+        for i in 0..10 * frames.len() {
+            let frame = &frames[i % frames.len()];
+            assert_eq!(producer.publish(frame).unwrap(), i as u64);
+            let message = fast.poll_with(Message::deserialize).unwrap().unwrap().unwrap();
+            assert_eq!(&message.serialize(), frame);
+            assert_eq!(fast.poll_with(|f| f.len()).unwrap(), None);
+        }
+        assert_eq!(fast.missed(), 0);
+        assert!(producer.consumer_lags().iter().any(|&(_, lag)| lag as usize > capacity));
+
+        assert_eq!(slow.poll_with(|f| f.to_vec()), Err(RING_LAPPED));
+        assert_eq!(slow.overruns(), 1);
+        producer.publish(&frames[0]).unwrap();
+        assert_eq!(slow.poll_with(|f| f.to_vec()).unwrap(), Some(frames[0].clone()));
+        assert_eq!(slow.next_seq(), Some(10 * frames.len() as u64 + 1));
+
+        drop(producer);
+        let mut producer = RingProducer::new(unsafe { Ring::create(base, len) }.unwrap());
+        assert_eq!(fast.poll_with(|f| f.to_vec()), Err(RING_RESET));
+        assert_eq!(fast.overruns(), 1);
+        producer.publish(&frames[0]).unwrap();
+        assert_eq!(fast.poll_with(|f| f.to_vec()).unwrap(), Some(frames[0].clone()));
+    }
+
+    #[test]
+    fn test_ring_reset_and_invalid_records() {
+        let frames = example_frames();
+        let (first, last) = (&frames[0], &frames[frames.len() - 1]);
+        let capacity = 8 * align8(8 + frames.iter().map(|f| f.len()).max().unwrap());
+        let mut memory = vec![0u64; (RING_HEADER_BYTES + capacity) / 8];
+        let (base, len) = (memory.as_mut_ptr() as *mut u8, memory.len() * 8);
+
+        let mut producer = RingProducer::new(unsafe { Ring::create(base, len) }.unwrap());
+        let mut consumer = RingConsumer::new(unsafe { Ring::attach(base, len) }.unwrap(), false).unwrap();
+        for _ in 0..3 {
+            producer.publish(first).unwrap();
+            assert_eq!(consumer.poll_with(|f| f.to_vec()).unwrap(), Some(first.clone()));
+        }
+
+        // a new producer writes past the old cursor before the consumer polls again
+        drop(producer);
+        let mut producer = RingProducer::new(unsafe { Ring::create(base, len) }.unwrap());
+        let mut late = RingConsumer::new(unsafe { Ring::attach(base, len) }.unwrap(), true).unwrap();
+        for _ in 0..5 {
+            producer.publish(last).unwrap();
+        }
+        assert!(producer.ring.write_pos() > consumer.cursor);
+        assert_eq!(consumer.poll_with(|f| f.to_vec()), Err(RING_RESET));
+        assert_eq!(consumer.overruns(), 1);
+        producer.publish(first).unwrap();
+        assert_eq!(consumer.poll_with(|f| f.to_vec()).unwrap(), Some(first.clone()));
+        assert_eq!(consumer.next_seq(), Some(6));
+
+        // consumer slots survive the re-create, so the old consumer cannot release the new one's
+        assert_ne!(late.slot, consumer.slot);
+        drop(consumer);
+        assert_eq!(producer.consumer_lags().len(), 1);
+        while late.poll_with(|f| f.len()).unwrap().is_some() {}
+
+        // an unreadable record resyncs the consumer instead of blocking it
+        let pos = producer.ring.write_pos() as usize;
+        producer.publish(first).unwrap();
+        unsafe { std::ptr::write_bytes(base.add(RING_HEADER_BYTES + pos % capacity + 8), 0, 4) };
+        assert_eq!(late.poll_with(|f| f.to_vec()), Err(RING_INVALID_RECORD));
+        assert_eq!(late.overruns(), 1);
+        producer.publish(first).unwrap();
+        assert_eq!(late.poll_with(|f| f.to_vec()).unwrap(), Some(first.clone()));
+        assert_eq!(late.missed(), 1);
+    }
+
+"""
+
     code += f"""}}\n"""
 
     return code
@@ -682,7 +3522,10 @@ def generate_rust_code_main_for_schema(schema, schema_name) -> str:
 
 
 def generate_python_tests_for_schema(schema, schema_name) -> str:
-    code = f"""from xparse import PyMessage\n\n\n"""
+    code = f"""import gc\n"""
+    code += f"""from multiprocessing import shared_memory\n\n"""
+    code += f"""import pytest\n\n"""
+    code += f"""from xparse import PyMessage, PyAggregator, PyBlockReader, PyBlockWriter, PyMergeIterator, PyRingConsumer, PyRingProducer, PySnapshotCache\n\n\n"""
     message_formats_schema = schema[1]
     enums_schema = schema[0]
     for message_format in message_formats_schema:
@@ -707,6 +3550,167 @@ def generate_python_tests_for_schema(schema, schema_name) -> str:
         code += f"""\t{name}_result = PyMessage.from_bytes({name}_bytes)\n\n"""
         code += f"""\tassert {name} == {name}_result\n\n\n"""
 
+    example_frames = ", ".join(
+        f"""open("{schema_name}_{message_format['name']}.xb", "rb").read()"""
+        for message_format in message_formats_schema
+    )
+
+    code += f"""def test_block_container_roundtrip(tmp_path):\n"""
+    code += f"""\tframes = [{example_frames}]\n"""
+    code += f"""\tpath = str(tmp_path / "capture.xbc")\n\n"""
+    code += f"""\twith PyBlockWriter(path, frames_per_block=2) as writer:\n"""
+    code += f"""\t\tfor _ in range(5):\n"""
+    code += f"""\t\t\twriter.extend(b"".join(frames))\n\n"""
+    code += f"""\treader = PyBlockReader(path)\n"""
+    code += f"""\tassert sum(block[3] for block in reader.index()) == 5 * len(frames)\n"""
+    code += f"""\tassert reader.read_block(0) == b"".join(frames * 2)[: reader.index()[0][2]]\n\n"""
+    code += f"""\tmessages = reader.decode_blocks()\n"""
+    code += f"""\tassert [bytes(m.to_bytes()) for m in messages] == frames * 5\n\n\n"""
+
+    code += f"""def test_block_writer_finishes_on_drop(tmp_path):\n"""
+    code += f"""\tframes = [{example_frames}]\n"""
+    code += f"""\tpath = str(tmp_path / "capture.xbc")\n\n"""
+    code += f"""\twriter = PyBlockWriter(path, frames_per_block=2)\n"""
+    code += f"""\twriter.extend(b"".join(frames))\n"""
+    code += f"""\twith pytest.raises(ValueError):\n"""
+    code += f"""\t\twriter.push(frames[0][:-1])\n"""
+    code += f"""\tdel writer\n"""
+    code += f"""\tgc.collect()\n\n"""
+    code += f"""\tmessages = PyBlockReader(path).decode_blocks()\n"""
+    code += f"""\tassert [bytes(m.to_bytes()) for m in messages] == frames\n\n"""
+    code += f"""\twith open(path, "r+b") as f:\n"""
+    code += f"""\t\tf.truncate(f.seek(0, 2) - 1)\n"""
+    code += f"""\twith pytest.raises(ValueError):\n"""
+    code += f"""\t\tPyBlockReader(path)\n\n\n"""
+
+    code += f"""def test_ring_buffer_fan_out():\n"""
+    code += f"""\tframes = [{example_frames}]\n"""
+    code += f"""\tshm = shared_memory.SharedMemory(create=True, size=PyRingProducer.required_size(1 << 16))\n\n"""
+    code += f"""\ttry:\n"""
+    code += f"""\t\tproducer = PyRingProducer(shm.buf)\n"""
+    code += f"""\t\tconsumers = [PyRingConsumer(shm.buf) for _ in range(3)]\n"""
+    code += f"""\t\tfor frame in frames * 5:\n"""
+    code += f"""\t\t\tproducer.publish(frame)\n\n"""
+    code += f"""\t\tfor consumer in consumers:\n"""
+    code += f"""\t\t\tassert [bytes(m.to_bytes()) for m in consumer.poll_batch()] == frames * 5\n"""
+    code += f"""\t\t\tassert consumer.poll() is None\n"""
+    code += f"""\t\t\tassert consumer.missed == 0\n"""
+    code += f"""\t\t\tconsumer.close()\n"""
+    code += f"""\t\tproducer.close()\n"""
+    code += f"""\tfinally:\n"""
+    code += f"""\t\tshm.close()\n"""
+    code += f"""\t\tshm.unlink()\n\n\n"""
+
+    first_format = message_formats_schema[0]
+    key_attribute = next(
+        attribute for attribute in first_format["attributes"] if attribute["type"] != "float"
+    )
+    key_value = get_test_python_value(get_rust_type(key_attribute), enums_schema)
+
+    code += f"""def test_aggregator_group_by(tmp_path):\n"""
+    code += f"""\tframe = open("{schema_name}_{first_format['name']}.xb", "rb").read()\n"""
+    code += f"""\tpath = tmp_path / "capture.xb"\n"""
+    code += f"""\tpath.write_bytes(frame * 4)\n\n"""
+    code += f"""\taggregator = PyAggregator("{first_format['name']}", ["{key_attribute['name']}"], [("count", None), ("last", "{key_attribute['name']}")])\n"""
+    code += f"""\taggregator.update_frames(frame * 2)\n"""
+    code += f"""\taggregator.update_file(str(path))\n\n"""
+    code += f"""\tassert aggregator.columns == ["{key_attribute['name']}", "count", "last_{key_attribute['name']}"]\n"""
+    code += f"""\tassert aggregator.result() == [({key_value}, 6, {key_value})]\n\n\n"""
+
+    code += f"""def test_snapshot_cache_latest_value():\n"""
+    code += f"""\tframe = open("{schema_name}_{first_format['name']}.xb", "rb").read()\n"""
+    code += f"""\tcache = PySnapshotCache("{first_format['name']}", ["{key_attribute['name']}"], max_entries=16)\n\n"""
+    code += f"""\tassert cache.ingest_frames(frame * 3) == 3\n"""
+    code += f"""\tassert len(cache) == 1\n"""
+    code += f"""\tassert ({key_value},) in cache\n"""
+    code += f"""\tassert cache.get(({key_value},)) == PyMessage.from_bytes(frame)\n"""
+    code += f"""\tassert cache.get_bytes({key_value}) == frame\n"""
+    code += f"""\tassert cache.keys() == [({key_value},)]\n"""
+    code += f"""\tassert cache.snapshot() == frame\n\n"""
+    code += f"""\tassert cache.remove(({key_value},))\n"""
+    code += f"""\tassert cache.get(({key_value},)) is None\n\n\n"""
+
+    key_position = first_format["attributes"].index(key_attribute)
+
+    code += f"""def test_record_export():\n"""
+    code += f"""\tframes = [{example_frames}]\n"""
+    code += f"""\tmessages = [PyMessage.from_bytes(frame) for frame in frames]\n\n"""
+    code += f"""\ttuples = PyMessage.batch_to_tuples(b"".join(frames))\n"""
+    code += f"""\tassert tuples == [message.to_tuple() for message in messages]\n"""
+    code += f"""\tassert tuples[0][{key_position}] == {key_value}\n\n"""
+    code += f"""\tdicts = PyMessage.batch_to_dicts(b"".join(frames), enum_names=True)\n"""
+    code += f"""\tassert dicts == [message.to_dict(enum_names=True) for message in messages]\n\n"""
+    code += f"""\trecords = PyMessage.batch_to_namedtuples(b"".join(frames))\n"""
+    code += f"""\tassert [tuple(record) for record in records] == tuples\n"""
+    code += f"""\tassert type(records[0]).__name__ == "{first_format['name'].capitalize()}"\n"""
+    code += f"""\tassert records[0]._fields == tuple(dicts[0])\n\n\n"""
+
+    merge_attribute = next(
+        (a for a in first_format["attributes"] if a["type"] in ("int", "uint")), None
+    )
+    if merge_attribute is not None:
+        constructor_args = ", ".join(
+            f"""{attribute['name']}=key"""
+            if attribute is merge_attribute
+            else f"""{attribute['name']}={get_test_python_value(get_rust_type(attribute), enums_schema)}"""
+            for attribute in first_format["attributes"]
+        )
+        code += f"""def test_merge_iterator(tmp_path):\n"""
+        code += f"""\tdef frame(key):\n"""
+        code += f"""\t\treturn bytes(PyMessage.{first_format['name']}({constructor_args}).to_bytes())\n\n"""
+        code += f"""\tpath = tmp_path / "even.xb"\n"""
+        code += f"""\tpath.write_bytes(b"".join(frame(key) for key in (0, 2, 4)))\n"""
+        code += f"""\todd = b"".join(frame(key) for key in (1, 3, 5))\n\n"""
+        code += f"""\tmerged = list(PyMergeIterator([str(path), odd], "{merge_attribute['name']}"))\n"""
+        code += f"""\tassert merged == [frame(key) for key in range(6)]\n\n"""
+        code += f"""\tdecoded = list(PyMergeIterator([odd, str(path)], "{merge_attribute['name']}", decode=True, read_ahead=64))\n"""
+        code += f"""\tassert decoded == [PyMessage.from_bytes(frame(key)) for key in range(6)]\n\n\n"""
+
+        other_format = next(
+            (f for f in message_formats_schema if all(a["name"] != merge_attribute["name"] for a in f["attributes"])), None
+        )
+        if other_format is not None:
+            code += f"""def test_merge_iterator_mixed_formats():\n"""
+            code += f"""\tdef frame(key):\n"""
+            code += f"""\t\treturn bytes(PyMessage.{first_format['name']}({constructor_args}).to_bytes())\n\n"""
+            code += f"""\tother = open("{schema_name}_{other_format['name']}.xb", "rb").read()\n"""
+            code += f"""\tmixed = frame(0) + other + frame(2) + frame(4)\n"""
+            code += f"""\todd = b"".join(frame(key) for key in (1, 3, 5))\n\n"""
+            code += f"""\tmerged = list(PyMergeIterator([odd, mixed], "{merge_attribute['name']}"))\n"""
+            code += f"""\tassert merged == [frame(0), other] + [frame(key) for key in range(1, 6)]\n\n\n"""
+
+    str_format = next(
+        (f for f in message_formats_schema if any(a["type"] == "str" for a in f["attributes"])), None
+    )
+    if str_format is not None:
+        str_position = next(
+            i for i, a in enumerate(str_format["attributes"]) if a["type"] == "str"
+        )
+        code += f"""def test_interned_str_fields():\n"""
+        code += f"""\tframe = open("{schema_name}_{str_format['name']}.xb", "rb").read()\n"""
+        code += f"""\tPyMessage.clear_intern_cache()\n\n"""
+        code += f"""\tfirst, second = PyMessage.batch_to_tuples(frame * 2)\n"""
+        code += f"""\tassert first[{str_position}] == 'John Doe'\n"""
+        code += f"""\tassert first[{str_position}] is second[{str_position}]\n"""
+        code += f"""\tstats = PyMessage.intern_stats()\n"""
+        code += f"""\tassert stats["hits"] >= 1 and stats["misses"] >= 1\n\n"""
+        code += f"""\tPyMessage.set_intern_capacity(0)\n"""
+        code += f"""\tfirst, second = PyMessage.batch_to_tuples(frame * 2)\n"""
+        code += f"""\tassert first[{str_position}] is not second[{str_position}]\n"""
+        code += f"""\tPyMessage.set_intern_capacity(8192)\n\n\n"""
+
+    enum_format = next(
+        (f for f in message_formats_schema if any(a["type"].lower() in enums_schema for a in f["attributes"])), None
+    )
+    if enum_format is not None:
+        enum_attribute = next(
+            a for a in enum_format["attributes"] if a["type"].lower() in enums_schema
+        )
+        code += f"""def test_enum_field_singletons():\n"""
+        code += f"""\tframe = open("{schema_name}_{enum_format['name']}.xb", "rb").read()\n"""
+        code += f"""\tfirst, second = PyMessage.batch_to_dicts(frame * 2, enum_names=True)\n"""
+        code += f"""\tassert first["{enum_attribute['name']}"] is second["{enum_attribute['name']}"]\n\n\n"""
+
     return code
 
 